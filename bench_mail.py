@@ -0,0 +1,75 @@
+"""
+Benchmarks for the mail_lib ingestion path, against fake_imap
+
+python ./bench_mail.py [messages ...] [--workers N] [--batch-size N] [--latency SECONDS] [--store]
+
+Each size is split over the default folders, a tenth of it in Sent Mail. Every run starts
+from no checkpoints, so all messages are fetched; a second run with tracemalloc on measures
+peak memory, since tracing slows the first one down.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from contacts_lib import ContactStore
+from fake_imap import FakeIMAPServer
+from mail_lib import DEFAULT_FOLDERS, FETCH_BATCH_SIZE, IMAP_WORKERS, ContactWriter, Ingestor
+
+
+def ingest(server, directory, workers, batch_size, store):
+    checkpoint_path = os.path.join(directory, 'checkpoints.json')
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if store:
+        writer = ContactStore(os.path.join(directory, 'contacts_%f.db' % time.time()))
+    else:
+        writer = ContactWriter(os.path.join(directory, 'contacts_%f.csv' % time.time()))
+
+    ingestor = Ingestor(server.connect, DEFAULT_FOLDERS, workers=workers, batch_size=batch_size,
+                        checkpoint_path=checkpoint_path)
+    with writer:
+        return ingestor.run(writer)
+
+
+def bench_ingest(messages, workers=IMAP_WORKERS, batch_size=FETCH_BATCH_SIZE, latency=0.0, store=False):
+    server = FakeIMAPServer({
+        '[Gmail]/Sent Mail': messages // 10,
+        '[Gmail]/Important': messages - messages // 10 - messages // 5,
+        '[Gmail]/Starred': messages // 5,
+    }, latency=latency, senders=max(10, messages // 4))
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        rows = ingest(server, directory, workers, batch_size, store)
+        elapsed = time.perf_counter() - start
+        commands, fetched, size = server.commands, server.messages_fetched, server.bytes_fetched
+
+        server.reset_counters()
+        tracemalloc.start()
+        ingest(server, directory, workers, batch_size, store)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(directory)
+
+    print('%8d messages, %d workers, batches of %d: %7.3fs %9.0f msgs/sec %6d commands '
+          '%11d bytes fetched %7d rows %8.1fMB peak' % (
+              fetched, workers, batch_size, elapsed, fetched / elapsed, commands, size, rows, peak / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time mail_lib ingestion against an in-process IMAP fake')
+    parser.add_argument('messages', nargs='*', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--workers', type=int, default=IMAP_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=FETCH_BATCH_SIZE)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per IMAP command')
+    parser.add_argument('--store', action='store_true', help='write to a ContactStore instead of a TSV')
+    args = parser.parse_args()
+
+    for messages in args.messages:
+        bench_ingest(messages, args.workers, args.batch_size, args.latency, args.store)
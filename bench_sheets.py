@@ -0,0 +1,130 @@
+"""
+Benchmarks for sheets_lib
+
+python ./bench_sheets.py [rows ...]            serialize_frame against the old upload code
+python ./bench_sheets.py sheets [cells ...]    Sheet calls against fake_sheets, with
+                                               FREECRM_BENCH_LATENCY seconds (default 0) per request
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet, serialize_frame
+
+LATENCY = float(os.environ.get('FREECRM_BENCH_LATENCY') or 0)
+
+
+def legacy_serialize(df):
+    """
+    what Sheet.upload did before serialize_frame, kept as the baseline
+    """
+    for col in df.keys():
+        try:
+            df[col] = df[col].fillna('')
+        except Exception:
+            pass
+    df = df.copy()
+
+    for column in df.columns:
+        for i in range(len(df)):
+            value = df[column].iloc[i]
+            if isinstance(value, datetime.date):
+                df[column] = pd.to_datetime(df[column]).dt.strftime(
+                    '%Y-%m-%d').str.replace('NaT', '')
+                break
+
+    return df.columns.tolist(), df.values.tolist()
+
+
+def sample_frame(rows, seed=0):
+    """
+    a contacts-like frame with the dtypes upload sees: strings, ints, floats with
+    NaN, date objects, datetimes with NaT and bools
+    """
+    rng = np.random.RandomState(seed)
+    first_day = datetime.date(2018, 5, 1)
+    amount = rng.rand(rows) * 100
+    amount[rng.rand(rows) < 0.1] = np.nan
+    seen = pd.Series(pd.to_datetime('2018-05-01') + pd.to_timedelta(rng.randint(0, 1000, rows), unit='D'))
+    seen[rng.rand(rows) < 0.1] = pd.NaT
+    return pd.DataFrame({
+        'name': ['Contact %d' % i for i in range(rows)],
+        'email': ['contact%d@example.com' % i for i in range(rows)],
+        'subject': np.where(rng.rand(rows) < 0.2, None, 'Re: civic writers'),
+        'messages': rng.randint(0, 500, rows),
+        'amount': amount,
+        'first_contact': [first_day + datetime.timedelta(days=int(d)) for d in rng.randint(0, 1000, rows)],
+        'last_seen': seen,
+        'confirmed': rng.rand(rows) < 0.5,
+    })
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_serialize(rows):
+    df = sample_frame(rows)
+    legacy_time, (legacy_header, legacy_values) = timed(legacy_serialize, df.copy())
+    new_time, (header, values) = timed(serialize_frame, df)
+    # the legacy path leaves NaN where a NaT date was, serialize_frame sends a blank
+    legacy_values = [['' if isinstance(c, float) and c != c else c for c in row] for row in legacy_values]
+    assert header == legacy_header and values == legacy_values
+    print('serialize %8d rows x %d cols: legacy %8.3fs  serialize_frame %7.3fs  (%.1fx)' %
+          (rows, df.shape[1], legacy_time, new_time, legacy_time / new_time))
+
+
+def measure(name, cells, service, fn, *args):
+    """
+    time one call and report the round trips and bytes it cost on the fake service
+    """
+    service.reset_counters()
+    elapsed, result = timed(fn, *args)
+    print('%-18s %8d cells: %8.3fs %6d round trips %11d bytes sent %11d bytes received' %
+          (name, cells, elapsed, service.requests, service.request_bytes, service.response_bytes))
+    return result
+
+
+def bench_sheet(cells, latency=LATENCY):
+    rows = max(1, cells // 10)
+    df = sample_frame(rows)
+    # hand made annotations on a tenth of the rows, for preserve and select_confirmed
+    annotated = df.copy()
+    annotated['action'] = np.where(np.arange(rows) % 10 == 0, 'confirmed', '')
+    annotated['action notes'] = np.where(np.arange(rows) % 10 == 0, 'checked', '')
+
+    service = FakeService({'contacts': []}, latency=latency)
+    # no rate limit, the point is what the library itself costs
+    sheet = Sheet('bench', service=service, executor=Executor())
+
+    measure('upload', cells, service, sheet.upload, 'contacts', annotated)
+    measure('load', cells, service, sheet.load, 'contacts')
+    cache_dir = tempfile.mkdtemp()
+    measure('preserve', cells, service, sheet.preserve, 'contacts', df.copy(), ['email'], ['action', 'action notes'], cache_dir)
+    shutil.rmtree(cache_dir)
+    measure('select_confirmed', cells, service, sheet.select_confirmed, 'contacts', df.copy(), ['email'])
+
+    labels = ['Contact %d' % i for i in range(0, rows, max(1, rows // 100))]
+    sheet.refresh()
+    measure('locate_cell cold', cells, service, sheet.locate_cell, 'contacts', labels[-1], 'email')
+    measure('locate_cell x%d' % len(labels), cells, service,
+            lambda: [sheet.locate_cell('contacts', label, 'email') for label in labels])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['sheets']:
+        for cells in [int(c) for c in sys.argv[2:]] or [1000, 100000, 1000000]:
+            bench_sheet(cells)
+    else:
+        for rows in [int(r) for r in sys.argv[1:]] or [1000, 10000, 100000]:
+            bench_serialize(rows)
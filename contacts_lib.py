@@ -0,0 +1,263 @@
+"""
+Local contact store, an indexed SQLite table keyed by canonical email.
+
+Ingestion upserts into it (ContactStore has the same write/checkpoint/close interface as
+mail_lib.ContactWriter) and downstream scripts read either everything, which is already
+unique by email, or only the rows changed since their own checkpoint.
+"""
+
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+STORE_FILE = os.environ.get('FREECRM_CONTACT_STORE') or './contacts.db'
+STORE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+# rows per read_csv chunk when streaming a TSV
+CHUNK_ROWS = int(os.environ.get('FREECRM_CHUNK_ROWS') or 100000)
+# how far canonical_email folds aliases: none, plus, or gmail
+ALIAS_FOLDING = os.environ.get('FREECRM_ALIAS_FOLDING') or 'none'
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+# a write session still open after this many seconds is taken for a crashed one, so it stops holding readers back
+SESSION_TIMEOUT = float(os.environ.get('FREECRM_STORE_SESSION_TIMEOUT') or 24 * 3600)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    email_key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_version ON contacts (version);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    consumer TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# a store written before there were sessions: its versions count as one completed session
+SEED_SESSIONS = """
+INSERT INTO sessions (version, started, completed)
+SELECT latest, 0, 1 FROM (SELECT MAX(version) AS latest FROM contacts)
+WHERE latest IS NOT NULL AND NOT EXISTS (SELECT 1 FROM sessions)
+"""
+
+# the highest version readers may see: below the oldest session still writing, else the newest one
+LATEST_VERSION = """
+SELECT COALESCE(
+    (SELECT MIN(version) - 1 FROM sessions WHERE completed = 0 AND started > ?),
+    (SELECT MAX(version) FROM sessions),
+    0)
+"""
+
+# first row for an email wins, like drop_duplicates('email'); a later row only fills in a blank name
+UPSERT = """
+INSERT INTO contacts (email_key, name, email, subject, version) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (email_key) DO UPDATE SET name = excluded.name, version = excluded.version
+WHERE contacts.name = '' AND excluded.name != ''
+"""
+
+
+def canonical_email(email, folding=ALIAS_FOLDING):
+    """
+    The key contacts are deduplicated and merged on: decoded, stripped and lowercased.
+    With folding='plus' the +tag is dropped from the mailbox, and with folding='gmail'
+    gmail addresses also lose the dots gmail ignores, so all aliases of one inbox share a key.
+    """
+    if isinstance(email, bytes):
+        email = email.decode('utf-8', 'replace')
+    email = str(email).strip().lower()
+
+    if folding == 'none' or '@' not in email:
+        return email
+
+    mailbox, _, domain = email.rpartition('@')
+    mailbox = mailbox.split('+', 1)[0] or mailbox
+    if folding == 'gmail' and domain in GMAIL_DOMAINS:
+        mailbox = mailbox.replace('.', '')
+        domain = 'gmail.com'
+    return '%s@%s' % (mailbox, domain)
+
+
+def is_store(path):
+    return path.lower().endswith(STORE_EXTENSIONS)
+
+
+class ContactStore:
+    """
+    Every write session gets a new version number, stamped on the rows it inserts or changes,
+    so a consumer can ask for the rows changed since the version it last processed.
+
+    The version is allocated in the sessions table when the session's first rows are written,
+    and the session is marked completed on close(). Rows are committed in batches while it
+    runs, so readers only see versions up to the oldest session still open; otherwise a reader
+    could set its checkpoint past rows a running ingest has yet to commit.
+    """
+
+    columns = ['name', 'email', 'subject']
+
+    def __init__(self, path=STORE_FILE, buffer_rows=1000):
+        self.path = path
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.rows_written = 0
+        self.version = None
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            self.conn.execute(SEED_SESSIONS)
+
+    def latest_version(self):
+        """
+        the newest version all of whose rows are committed
+        """
+        return self.conn.execute(LATEST_VERSION, (time.time() - SESSION_TIMEOUT,)).fetchone()[0]
+
+    def _open_session(self):
+        with self.conn:
+            self.version = self.conn.execute('INSERT INTO sessions (started) VALUES (?)', (time.time(),)).lastrowid
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.version is None:
+            self._open_session()
+
+        params = [(canonical_email(email), '' if name is None else str(name), str(email).strip(),
+                   '' if subject is None else str(subject), self.version)
+                  for name, email, subject in self.buffer]
+        with self.conn:
+            self.conn.executemany(UPSERT, params)
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def checkpoint(self):
+        """
+        commit everything written so far
+        """
+        self.flush()
+
+    def close(self):
+        if self.conn is not None:
+            self.checkpoint()
+            if self.version is not None:
+                with self.conn:
+                    self.conn.execute('UPDATE sessions SET completed = 1 WHERE version = ?', (self.version,))
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def import_tsv(self, path, chunksize=CHUNK_ROWS):
+        """
+        Load an existing contacts TSV, like contacts.csv, into the store
+        """
+        for chunk in pd.read_csv(path, sep='\t', chunksize=chunksize, dtype=str, keep_default_na=False):
+            chunk = chunk[chunk.email != '']
+            for row in chunk[self.columns].itertuples(index=False, name=None):
+                self.write(row)
+        self.checkpoint()
+        return self.rows_written
+
+    def to_dataframe(self, since=0, until=None):
+        """
+        Contacts changed after version `since` (and up to `until`), in first-seen order
+        """
+        if until is None:
+            until = self.latest_version()
+        return pd.read_sql_query(
+            'SELECT name, email, subject FROM contacts WHERE version > ? AND version <= ? ORDER BY seq',
+            self.conn, params=(since, until))
+
+    def email_keys(self):
+        """
+        set of the canonical emails in the store
+        """
+        return {key for key, in self.conn.execute('SELECT email_key FROM contacts')}
+
+    def get_checkpoint(self, consumer):
+        row = self.conn.execute('SELECT version FROM checkpoints WHERE consumer = ?', (consumer,)).fetchone()
+        return row[0] if row else 0
+
+    def set_checkpoint(self, consumer, version):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO checkpoints (consumer, version) VALUES (?, ?)',
+                              (consumer, version))
+
+
+def iter_unique(path, key='email', chunksize=CHUNK_ROWS, normalize=None):
+    """
+    Generator of DataFrame chunks with the first row for each key in a TSV file.
+
+    Together the chunks hold the same rows, index and order as
+    pd.read_csv(path, sep='\\t').drop_duplicates(key), but the file is read chunksize rows
+    at a time and only the set of keys seen so far is kept between chunks.
+    With normalize, a function like canonical_email, the key column is mapped through it first.
+    """
+    seen = set()
+    for chunk in pd.read_csv(path, sep='\t', chunksize=chunksize):
+        if normalize is not None:
+            chunk[key] = chunk[key].map(normalize, na_action='ignore')
+        chunk = chunk.drop_duplicates(key)
+
+        # drop_duplicates treats all nulls as one key; None stands in for them in the set
+        keys = chunk[key].astype(object).where(chunk[key].notnull(), None)
+        first_seen = [k not in seen for k in keys]
+        seen.update(keys)
+
+        chunk = chunk[first_seen]
+        if len(chunk):
+            yield chunk
+
+
+def read_contacts(path, chunksize=None):
+    """
+    Contacts from a TSV file or a store, one row per canonical email.
+    With chunksize the TSV is deduplicated while streaming it, so memory is bounded
+    by the number of unique contacts rather than by the size of the file.
+
+    Emails come back canonical, so rows logged before ingest canonicalized them merge
+    with the newer ones.
+    """
+    if is_store(path):
+        with ContactStore(path) as store:
+            df = store.to_dataframe()
+        df['email'] = df.email.map(canonical_email)
+        return df
+
+    if chunksize:
+        chunks = list(iter_unique(path, chunksize=chunksize, normalize=canonical_email))
+        if not chunks:
+            return pd.read_csv(path, sep='\t', nrows=0)
+        return pd.concat(chunks)
+
+    df = pd.read_csv(path, sep='\t')
+    df['email'] = df.email.map(canonical_email, na_action='ignore')
+    return df.drop_duplicates('email')
+
+
+if __name__ == '__main__':
+    import sys
+
+    # python ./contacts_lib.py contacts.csv [contacts.db]
+    with ContactStore(sys.argv[2] if len(sys.argv) > 2 else STORE_FILE) as store:
+        print('%d rows imported into %s' % (store.import_tsv(sys.argv[1]), store.path))
@@ -0,0 +1,198 @@
+"""
+In-process stand-in for an IMAP server, enough of IMAPClient for mail_lib.Ingestor
+
+    server = FakeIMAPServer({'[Gmail]/Important': 10000, '[Gmail]/Sent Mail': 2000})
+    Ingestor(server.connect, DEFAULT_FOLDERS).run(writer)
+    print(server.commands, server.messages_fetched, server.bytes_fetched)
+
+Folders hold synthetic messages, `per_day` a day from `first_date` on, whose envelopes
+are built on fetch from the uid, so a large folder costs no memory until it is read. The
+envelopes mix in what real mail has: no reply_to, None names, str and bytes subjects, no
+subject, group addresses without a host, upper case and +tagged emails, undecodable bytes,
+tabs in subjects and senders that write again and again.
+"""
+
+import datetime
+import random
+import threading
+import time
+from collections import namedtuple
+
+# same fields as imapclient.response_types.Envelope and Address
+Envelope = namedtuple('Envelope', ['date', 'subject', 'from_', 'sender', 'reply_to', 'to', 'cc', 'bcc',
+                                   'in_reply_to', 'message_id'])
+Address = namedtuple('Address', ['name', 'route', 'mailbox', 'host'])
+
+SUBJECTS = [b'Re: civic writers', 'Someone wants to join', b'Weekly update', b'Invoice\t#1234',
+            'Café meetup', b'Caf\xe9 meetup', None, b'']
+DOMAINS = [b'example.com', b'EXAMPLE.org', b'gmail.com', b'volunteermatch.org']
+
+
+def make_envelope(seed, uid, date, senders=1000):
+    """
+    the envelope of message `uid`, the same every time for the same seed
+    """
+    rng = random.Random(seed * 1000003 + uid)
+    n = rng.randrange(senders)
+    host = DOMAINS[n % len(DOMAINS)]
+    mailbox = b'person%d' % n
+    if n % 7 == 0:
+        mailbox = mailbox.upper()
+    if n % 11 == 0:
+        mailbox += b'+crm'
+    if host == b'gmail.com' and n % 5 == 0:
+        mailbox = mailbox[:3] + b'.' + mailbox[3:]
+    name = None if n % 3 == 0 else (b'Person %d' % n if n % 2 else 'Persön %d' % n)
+
+    sender = Address(name, None, mailbox, host)
+    kind = uid % 20
+    if kind == 0:
+        # group syntax, "undisclosed-recipients:;" has a mailbox but no host
+        to = (Address(None, None, b'undisclosed-recipients', None),)
+    elif kind == 1:
+        to = None
+    else:
+        to = (Address(b'Me', None, b'me', b'example.com'), sender)
+    reply_to = None if kind in (2, 3) else (sender,)
+
+    return Envelope(
+        date=datetime.datetime.combine(date, datetime.time(12)),
+        subject=SUBJECTS[rng.randrange(len(SUBJECTS))],
+        from_=(sender,),
+        sender=(sender,),
+        reply_to=reply_to,
+        to=to,
+        cc=None,
+        bcc=None,
+        in_reply_to=None,
+        message_id=b'<%d.%d@fake>' % (seed, uid),
+    )
+
+
+def envelope_size(envelope):
+    """
+    rough size of the envelope on the wire, the length of its text
+    """
+    return len(repr(envelope))
+
+
+class FakeFolder:
+
+    def __init__(self, name, size, seed, first_date, per_day):
+        self.name = name
+        self.seed = seed
+        self.uidvalidity = seed + 1
+        self.first_date = first_date
+        self.per_day = per_day
+        self.size = size
+
+    def add_messages(self, count):
+        """
+        new mail, with the next uids and dates
+        """
+        self.size += count
+
+    def date(self, uid):
+        return self.first_date + datetime.timedelta(days=(uid - 1) // self.per_day)
+
+    def uids(self):
+        return range(1, self.size + 1)
+
+
+class FakeIMAPServer:
+    """
+    Folders shared by every connection; `folders` is {name: message count}.
+    Every command sleeps `latency` seconds and is counted.
+    """
+
+    def __init__(self, folders=None, latency=0.0, senders=1000, first_date=datetime.date(2018, 5, 1), per_day=20):
+        self.latency = latency
+        self.senders = senders
+        # by default the folders getmymail.py reads
+        folders = folders or {'[Gmail]/Sent Mail': 200, '[Gmail]/Important': 1000, '[Gmail]/Starred': 100}
+        self.folders = {name: FakeFolder(name, size, seed, first_date, per_day)
+                        for seed, (name, size) in enumerate(sorted(folders.items()))}
+        self.lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.logins = 0
+        self.commands = 0
+        self.messages_fetched = 0
+        self.bytes_fetched = 0
+
+    def reset_uidvalidity(self, folder):
+        """
+        what happens when a folder is rebuilt on the server: every uid a client knows is void
+        """
+        self.folders[folder].uidvalidity += 1
+
+    def connect(self):
+        """
+        a new, logged in connection; pass this as Ingestor's connect
+        """
+        client = FakeIMAPClient(self)
+        client.login('fake', 'fake')
+        return client
+
+    def _command(self, messages=0, size=0):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.commands += 1
+            self.messages_fetched += messages
+            self.bytes_fetched += size
+
+
+class FakeIMAPClient:
+    """
+    The IMAPClient calls mail_lib makes, with use_uid=True
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.folder = None
+
+    def login(self, username, password):
+        self.server._command()
+        with self.server.lock:
+            self.server.logins += 1
+        return b'LOGIN completed'
+
+    def logout(self):
+        self.server._command()
+        return b'LOGOUT completed'
+
+    def select_folder(self, folder, readonly=False):
+        self.server._command()
+        if folder not in self.server.folders:
+            raise KeyError('no such folder %s' % folder)
+        self.folder = self.server.folders[folder]
+        return {b'UIDVALIDITY': self.folder.uidvalidity, b'EXISTS': self.folder.size, b'UIDNEXT': self.folder.size + 1}
+
+    def search(self, criteria):
+        """
+        only the two searches mail_lib makes: ['SINCE', date] and ['UID', 'n:*']
+        """
+        self.server._command()
+        key, value = criteria
+        uids = self.folder.uids()
+        if key == u'SINCE':
+            return [uid for uid in uids if self.folder.date(uid) >= value]
+        if key == u'UID':
+            first = int(value.split(':')[0])
+            # like a real server, n:* matches the highest uid even when it is below n
+            return [uid for uid in uids if uid >= first] or list(uids[-1:])
+        raise ValueError('search %r is not faked' % (criteria,))
+
+    def fetch(self, uids, data):
+        folder = self.folder
+        response = {}
+        size = 0
+        for uid in uids:
+            if 1 <= uid <= folder.size:
+                envelope = make_envelope(folder.seed, uid, folder.date(uid), self.server.senders)
+                response[uid] = {b'SEQ': uid, b'ENVELOPE': envelope}
+                size += envelope_size(envelope)
+        self.server._command(len(response), size)
+        return response
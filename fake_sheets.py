@@ -0,0 +1,361 @@
+"""
+In-process stand-in for the part of the Google Sheets v4 api that sheets_lib.Sheet uses,
+for benchmarks and for trying changes without a Google account.
+
+    service = FakeService(latency=0.05)
+    sheet = Sheet('doc', service=service, executor=Executor())
+    sheet.upload('raw', df)
+    print(service.requests, service.request_bytes, service.response_bytes)
+
+Cells are kept per tab as lists of rows. Values written USER_ENTERED are stored the way
+Sheets would parse them (numbers become numbers, formulas stay formulas) and read back
+formatted, unformatted or as formulas like the real api; formats and validation are accepted
+and ignored. Every request sleeps `latency` seconds and is counted with its json payload size.
+"""
+
+import json
+import re
+import string
+import threading
+import time
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from sheets_lib import column_letter
+
+RANGE_RE = re.compile(r"^'?(?P<title>.*?)'?(?:!(?P<start>[A-Z]*)(?P<start_row>\d*)(?::(?P<end>[A-Z]*)(?P<end_row>\d*))?)?$")
+NUMBER_RE = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + string.ascii_uppercase.index(letter) + 1
+    return index - 1
+
+
+def parse_range(a1):
+    """
+    'Tab'!B2:D10 -> (title, first row, first column, end row, end column), 0 based with
+    exclusive ends, None for an open end
+    """
+    m = RANGE_RE.match(a1)
+    title = m.group('title')
+    start, start_row = m.group('start'), m.group('start_row')
+    end, end_row = m.group('end'), m.group('end_row')
+
+    row0 = int(start_row) - 1 if start_row else 0
+    col0 = _column_index(start) if start else 0
+    if end is None and end_row is None:
+        # a single cell, or the whole tab
+        if start or start_row:
+            return title, row0, col0, row0 + 1 if start_row else None, col0 + 1 if start else None
+        return title, 0, 0, None, None
+    return title, row0, col0, int(end_row) if end_row else None, _column_index(end) + 1 if end else None
+
+
+def _parse_entered(value):
+    """
+    a USER_ENTERED value as Sheets stores it
+    """
+    if isinstance(value, str) and NUMBER_RE.match(value):
+        number = float(value)
+        return int(number) if number.is_integer() and '.' not in value else number
+    return value
+
+
+def _render(value, render):
+    # formulas are not evaluated, UNFORMATTED_VALUE gives them back as written
+    if render in ('UNFORMATTED_VALUE', 'FORMULA'):
+        return value
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _trim(rows):
+    """
+    drop trailing blank cells and rows, the api never returns them
+    """
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] in ('', None):
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+class FakeRequest:
+    """
+    what a googleapiclient method returns: call execute() to run it
+    """
+
+    def __init__(self, service, method_id, params, fn):
+        self.service = service
+        self.methodId = method_id
+        self.uri = 'fake://' + method_id
+        self.params = {k: v for k, v in params.items() if k not in ('self', 'fn')}
+        self.fn = fn
+
+    @property
+    def body(self):
+        return json.dumps(self.params, default=str)
+
+    def execute(self, http=None, num_retries=0):
+        return self.service._execute(self)
+
+
+class _Values:
+
+    def __init__(self, service):
+        self.service = service
+
+    def _request(self, method, params, fn):
+        return FakeRequest(self.service, 'sheets.spreadsheets.values.' + method, params, fn)
+
+    def get(self, spreadsheetId, range, valueRenderOption='FORMATTED_VALUE',
+            dateTimeRenderOption=None, majorDimension='ROWS'):
+        return self._request('get', locals(), lambda: self.service._read(range, valueRenderOption, majorDimension))
+
+    def batchGet(self, spreadsheetId, ranges, valueRenderOption='FORMATTED_VALUE',
+                 dateTimeRenderOption=None, majorDimension='ROWS'):
+        def fn():
+            return {'spreadsheetId': spreadsheetId, 'valueRanges': [
+                self.service._read(r, valueRenderOption, majorDimension) for r in ranges]}
+        return self._request('batchGet', locals(), fn)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        return self._request('update', locals(), lambda: self.service._write(range, body['values'], valueInputOption))
+
+    def batchUpdate(self, spreadsheetId, body):
+        def fn():
+            replies = [self.service._write(d['range'], d['values'], body['valueInputOption']) for d in body['data']]
+            return {'spreadsheetId': spreadsheetId, 'responses': replies,
+                    'totalUpdatedCells': sum(r['updatedCells'] for r in replies)}
+        return self._request('batchUpdate', locals(), fn)
+
+    def append(self, spreadsheetId, range, valueInputOption, body, insertDataOption='OVERWRITE'):
+        def fn():
+            title = parse_range(range)[0]
+            # below the last row with a value
+            rows = _trim(self.service._tab(title)['rows'])
+            return {'spreadsheetId': spreadsheetId,
+                    'updates': self.service._write("'%s'!A%d" % (title, len(rows) + 1), body['values'], valueInputOption)}
+        return self._request('append', locals(), fn)
+
+    def clear(self, spreadsheetId, range, body):
+        return self._request('clear', locals(), lambda: self.service._clear(range))
+
+
+class _Sheets:
+
+    def __init__(self, service):
+        self.service = service
+
+    def copyTo(self, spreadsheetId, sheetId, body):
+        def fn():
+            tab = self.service._tab_by_id(sheetId)
+            if body.get('destination_spreadsheet_id', body.get('destinationSpreadsheetId')) != spreadsheetId:
+                # another document, which this fake does not hold
+                return {'sheetId': 0, 'title': tab['title']}
+            copy = self.service._add_tab({'title': 'Copy of %s' % tab['title']})
+            copy['rows'] = [list(row) for row in tab['rows']]
+            return self.service._properties(copy)
+        return FakeRequest(self.service, 'sheets.spreadsheets.sheets.copyTo', locals(), fn)
+
+
+class _Spreadsheets:
+
+    def __init__(self, service):
+        self.service = service
+
+    def values(self):
+        return _Values(self.service)
+
+    def sheets(self):
+        return _Sheets(self.service)
+
+    def get(self, spreadsheetId, **kwargs):
+        return FakeRequest(self.service, 'sheets.spreadsheets.get', locals(), self.service._metadata)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def fn():
+            return {'spreadsheetId': spreadsheetId,
+                    'replies': [self.service._apply(request) for request in body['requests']]}
+        return FakeRequest(self.service, 'sheets.spreadsheets.batchUpdate', locals(), fn)
+
+
+class FakeService:
+    """
+    Drop in for the object discovery.build returns, holding one spreadsheet.
+    `tabs` is {title: rows} to start from; by default there is one empty tab, Sheet1.
+    """
+
+    def __init__(self, tabs=None, latency=0.0, title='fake'):
+        self.latency = latency
+        self.title = title
+        self.lock = threading.Lock()
+        self.tabs = []
+        self.next_sheet_id = 0
+        for name, rows in (tabs or {'Sheet1': []}).items():
+            self._add_tab({'title': name})['rows'] = [list(row) for row in rows]
+        # statuses to fail the next requests with, see fail_next
+        self.failures = []
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.calls = Counter()
+
+    def fail_next(self, status=429, count=1):
+        """
+        make the next `count` requests raise an HttpError with this status
+        """
+        self.failures.extend([status] * count)
+
+    def spreadsheets(self):
+        return _Spreadsheets(self)
+
+    def _execute(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            self.calls[request.methodId] += 1
+            self.request_bytes += len(request.body)
+            if self.failures:
+                status = self.failures.pop(0)
+                raise HttpError(httplib2.Response({'status': status}), b'{"error": "fake"}')
+            response = request.fn()
+            self.response_bytes += len(json.dumps(response, default=str))
+        return response
+
+    # tabs
+
+    def _add_tab(self, properties):
+        if any(tab['title'] == properties['title'] for tab in self.tabs):
+            raise HttpError(httplib2.Response({'status': 400}),
+                            b'{"error": "A sheet with that name already exists"}')
+        grid = properties.get('gridProperties', {})
+        tab = {'sheetId': properties.get('sheetId', self.next_sheet_id), 'title': properties['title'],
+               'hidden': properties.get('hidden', False), 'rowCount': grid.get('rowCount', 1000),
+               'columnCount': grid.get('columnCount', 26), 'rows': []}
+        self.next_sheet_id = max(self.next_sheet_id, tab['sheetId']) + 1
+        self.tabs.append(tab)
+        return tab
+
+    def _tab(self, title):
+        for tab in self.tabs:
+            if tab['title'] == title:
+                return tab
+        raise HttpError(httplib2.Response({'status': 400}), b'{"error": "Unable to parse range"}')
+
+    def _tab_by_id(self, sheet_id):
+        for tab in self.tabs:
+            if tab['sheetId'] == sheet_id:
+                return tab
+        raise HttpError(httplib2.Response({'status': 400}), b'{"error": "No grid with id"}')
+
+    def _properties(self, tab):
+        properties = {'sheetId': tab['sheetId'], 'title': tab['title'], 'index': self.tabs.index(tab),
+                      'gridProperties': {'rowCount': tab['rowCount'], 'columnCount': tab['columnCount']}}
+        if tab['hidden']:
+            properties['hidden'] = True
+        return properties
+
+    def _metadata(self):
+        return {'properties': {'title': self.title},
+                'sheets': [{'properties': self._properties(tab)} for tab in self.tabs]}
+
+    # cells
+
+    def _read(self, a1, render='FORMATTED_VALUE', major='ROWS'):
+        title, row0, col0, row1, col1 = parse_range(a1)
+        rows = self._tab(title)['rows'][row0:row1]
+        rows = _trim([[_render(v, render) for v in row[col0:col1]] for row in rows])
+        if major == 'COLUMNS' and rows:
+            width = max(len(row) for row in rows)
+            rows = _trim([[row[i] if i < len(row) else '' for row in rows] for i in range(width)])
+        result = {'range': a1, 'majorDimension': major}
+        if rows:
+            result['values'] = rows
+        return result
+
+    def _write(self, a1, values, input_option='USER_ENTERED'):
+        title, row0, col0, _, _ = parse_range(a1)
+        tab = self._tab(title)
+        rows = tab['rows']
+        cells = 0
+        for i, values_row in enumerate(values):
+            while len(rows) <= row0 + i:
+                rows.append([])
+            row = rows[row0 + i]
+            if len(row) < col0 + len(values_row):
+                row.extend([''] * (col0 + len(values_row) - len(row)))
+            for j, value in enumerate(values_row):
+                row[col0 + j] = _parse_entered(value) if input_option == 'USER_ENTERED' else value
+            cells += len(values_row)
+        tab['rowCount'] = max(tab['rowCount'], len(rows))
+        return {'updatedRange': a1, 'updatedRows': len(values), 'updatedCells': cells}
+
+    def _clear_grid(self, tab, row0, col0, row1, col1):
+        for row in tab['rows'][row0:row1]:
+            end = len(row) if col1 is None else min(col1, len(row))
+            for j in range(col0, end):
+                row[j] = ''
+        tab['rows'] = _trim(tab['rows'])
+
+    def _clear(self, a1):
+        title, row0, col0, row1, col1 = parse_range(a1)
+        self._clear_grid(self._tab(title), row0, col0, row1, col1)
+        return {'clearedRange': a1}
+
+    def _grid(self, grid_range):
+        return (self._tab_by_id(grid_range.get('sheetId', 0)), grid_range.get('startRowIndex', 0),
+                grid_range.get('startColumnIndex', 0), grid_range.get('endRowIndex'), grid_range.get('endColumnIndex'))
+
+    def _apply(self, request):
+        """
+        one spreadsheets.batchUpdate request
+        """
+        (kind, body), = request.items()
+        if kind == 'addSheet':
+            return {'addSheet': {'properties': self._properties(self._add_tab(body['properties']))}}
+        if kind == 'deleteSheet':
+            self.tabs.remove(self._tab_by_id(body['sheetId']))
+        elif kind == 'updateSheetProperties':
+            properties = body['properties']
+            tab = self._tab_by_id(properties.get('sheetId', 0))
+            grid = properties.get('gridProperties', {})
+            tab['rowCount'] = grid.get('rowCount', tab['rowCount'])
+            tab['columnCount'] = grid.get('columnCount', tab['columnCount'])
+            tab['title'] = properties.get('title', tab['title'])
+            tab['hidden'] = properties.get('hidden', tab['hidden'])
+        elif kind == 'updateCells':
+            if body['fields'] == 'userEnteredValue' and 'rows' not in body:
+                self._clear_grid(*self._grid(body['range']))
+        elif kind == 'deleteDimension':
+            grid = body['range']
+            tab = self._tab_by_id(grid.get('sheetId', 0))
+            if grid['dimension'] == 'ROWS':
+                del tab['rows'][grid['startIndex']:grid['endIndex']]
+                tab['rowCount'] -= grid['endIndex'] - grid['startIndex']
+            else:
+                for row in tab['rows']:
+                    del row[grid['startIndex']:grid['endIndex']]
+                tab['columnCount'] -= grid['endIndex'] - grid['startIndex']
+        elif kind == 'copyPaste':
+            source, row0, col0, row1, col1 = self._grid(body['source'])
+            destination, drow, dcol = self._grid(body['destination'])[:3]
+            values = [row[col0:col1] for row in source['rows'][row0:row1]]
+            self._write("'%s'!%s%d" % (destination['title'], column_letter(dcol), drow + 1), values, 'RAW')
+        elif kind not in ('repeatCell', 'setDataValidation', 'updateSpreadsheetProperties'):
+            raise HttpError(httplib2.Response({'status': 400}), ('{"error": "%s is not faked"}' % kind).encode())
+        return {}
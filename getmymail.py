@@ -1,51 +1,10 @@
-from imapclient import IMAPClient
-from datetime import date
-import os
+"""
+Log the contacts from new gmail messages to contacts.csv
 
-GMAIL_USERNAME = os.environ.get('GMAIL_USERNAME')
-GMAIL_PASSWORD = os.environ.get('GMAIL_PASSWORD')
-CONTACTS_FILE = os.environ.get('FREECRM_CONTACTS_FILE') or './contacts.csv'
+python ./getmymail.py --help for the options, or use mail_lib.Ingestor directly
+"""
+from mail_lib import main
 
 
-server = IMAPClient('imap.gmail.com', use_uid=True)
-server.login(GMAIL_USERNAME, GMAIL_PASSWORD)
-
-
-def log_contacts(folder, sent=False):
-    server.select_folder(folder)
-#	messages = server.search([u'ALL'])
-    messages = server.search([u'SINCE', date(2018, 5, 1)])  # ALL to fetch all
-
-    for msgid, data in server.fetch(messages, [b'ENVELOPE']).items():
-        try:
-            envelope = data[b'ENVELOPE']
-            if sent:
-                name = envelope.to[0].name or b''
-                email = "%s@%s" % (envelope.to[0].mailbox, envelope.to[0].host)
-            else:
-                from_obj = envelope.reply_to[0] or envelope.from_[0]
-                name = from_obj.name or b''
-#                        if name == 'Volunteermatch':
-#                            import pdb; pdb.set_trace()
-                email = "%s@%s" % (from_obj.mailbox.decode(), from_obj.host.decode())
-            subject = envelope.subject or b''
-            try:
-                subject = subject.decode()
-            except AttributeError:
-                pass
-            subject = subject.replace('\t', ' ')
-            try:
-                name = name.decode()
-            except AttributeError:
-                pass
-            with open(CONTACTS_FILE, 'a') as f:
-                f.write("%s\t%s\t%s\n" % (name, email, subject))
-
-        except AttributeError as e:
-            print("Error: " + str(e))
-            pass
-
-
-log_contacts('[Gmail]/Sent Mail', sent='true')
-log_contacts('[Gmail]/Important')
-log_contacts('[Gmail]/Starred')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Contact ingestion from IMAP folders.
+
+Nothing here connects at import time; build an Ingestor with a connection factory,
+or run the command line entry point (getmymail.py is a thin wrapper around main()).
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import perf_lib
+from contacts_lib import ContactStore, canonical_email
+
+GMAIL_USERNAME = os.environ.get('GMAIL_USERNAME')
+GMAIL_PASSWORD = os.environ.get('GMAIL_PASSWORD')
+IMAP_HOST = os.environ.get('FREECRM_IMAP_HOST') or 'imap.gmail.com'
+CONTACTS_FILE = os.environ.get('FREECRM_CONTACTS_FILE') or './contacts.csv'
+CHECKPOINT_FILE = os.environ.get('FREECRM_CHECKPOINT_FILE') or './.imap_checkpoints.json'
+SINCE = date(2018, 5, 1)  # oldest mail fetched when a folder has no checkpoint
+# messages per FETCH round trip; raise it on high latency links, lower it to cap memory
+FETCH_BATCH_SIZE = int(os.environ.get('FREECRM_FETCH_BATCH_SIZE') or 500)
+# folders synced in parallel, each on its own IMAP connection (gmail allows 15 per account)
+IMAP_WORKERS = int(os.environ.get('FREECRM_IMAP_WORKERS') or 3)
+
+SENT = 'sent'
+RECEIVED = 'received'
+
+# role tells whether the contact is the recipient (sent) or the sender (received) of a message
+Folder = namedtuple('Folder', ['name', 'role'])
+
+DEFAULT_FOLDERS = [
+    Folder('[Gmail]/Sent Mail', SENT),
+    Folder('[Gmail]/Important', RECEIVED),
+    Folder('[Gmail]/Starred', RECEIVED),
+]
+
+
+def load_checkpoints(path=CHECKPOINT_FILE):
+    """
+    Per folder sync state, {folder: {'uidvalidity': int, 'last_uid': int}}
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoints(checkpoints, path=CHECKPOINT_FILE):
+    """
+    write to a temp file and rename, so a crash never leaves a half written checkpoint
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoints, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def update_checkpoint(checkpoints, folder, uidvalidity, uids):
+    """
+    record the highest UID processed for the folder
+    """
+    checkpoint = checkpoints.get(folder)
+    if checkpoint and checkpoint['uidvalidity'] == uidvalidity:
+        last_uid = checkpoint['last_uid']
+    else:
+        last_uid = 0
+    checkpoints[folder] = {'uidvalidity': uidvalidity, 'last_uid': max([last_uid] + list(uids))}
+
+
+def search_new(server, folder, checkpoints, since):
+    """
+    Select the folder and return (uidvalidity, uids) for the messages not seen by a previous run.
+
+    Only UIDs above the folder's checkpoint are searched. If the folder's UIDVALIDITY
+    changed the old UIDs mean nothing any more, so fall back to a full resync from `since`.
+    """
+    with perf_lib.span('imap', 'search', folder) as timing:
+        folder_info = server.select_folder(folder)
+        uidvalidity = folder_info[b'UIDVALIDITY']
+
+        checkpoint = checkpoints.get(folder)
+        if checkpoint and checkpoint['uidvalidity'] == uidvalidity:
+            last_uid = checkpoint['last_uid']
+            # 'n:*' always matches the highest UID in the folder, even when it is below n
+            uids = [uid for uid in server.search([u'UID', u'%d:*' % (last_uid + 1)]) if uid > last_uid]
+        else:
+            if checkpoint:
+                print('UIDVALIDITY changed for %s, doing a full resync' % folder)
+            uids = server.search([u'SINCE', since])
+        timing.add(messages=len(uids))
+
+    return uidvalidity, uids
+
+
+def fetch_envelopes(server, uids, batch_size=FETCH_BATCH_SIZE, folder=None):
+    """
+    Generator of (uid, envelope) for the given UIDs, fetched batch_size messages at a time.
+
+    Only one batch of the IMAP response is held in memory, and callers can start
+    processing before the rest of the folder has been fetched.
+    """
+    uids = sorted(uids)
+    for start in range(0, len(uids), batch_size):
+        with perf_lib.span('imap', 'fetch', folder) as timing:
+            response = server.fetch(uids[start:start + batch_size], [b'ENVELOPE'])
+            if perf_lib.ENABLED:
+                # imapclient keeps no raw response, the envelope's text length stands in for its size
+                timing.add(messages=len(response), bytes=sum(len(repr(r[b'ENVELOPE'])) for r in response.values()))
+        for uid in sorted(response):
+            yield uid, response[uid][b'ENVELOPE']
+
+
+class ContactWriter:
+    """
+    Buffered writer for the contacts TSV, opened once per ingestion run.
+
+    Rows are csv quoted, so a tab or newline in a name or subject can't break
+    the tab separated read in parse_mail.py. Call checkpoint() before recording
+    a folder checkpoint so the rows it covers are on disk first.
+    """
+
+    columns = ['name', 'email', 'subject']
+
+    def __init__(self, path, buffer_rows=1000):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        self.path = path
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.rows_written = 0
+        self.f = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f, delimiter='\t', lineterminator='\n')
+
+        if write_header:
+            self.writer.writerow(self.columns)
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.buffer)
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+        self.f.flush()
+
+    def checkpoint(self):
+        """
+        flush and fsync everything written so far
+        """
+        self.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        if not self.f.closed:
+            self.checkpoint()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def imap_connect(host=IMAP_HOST, username=GMAIL_USERNAME, password=GMAIL_PASSWORD):
+    """
+    Connection factory for Ingestor, each call opens and logs in a new IMAPClient
+    """
+    def connect():
+        from imapclient import IMAPClient
+
+        server = IMAPClient(host, use_uid=True)
+        server.login(username, password)
+        return server
+
+    return connect
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value or ''
+
+
+def address_email(address):
+    """
+    canonical email of an envelope Address, None for group markers without a mailbox or host
+    """
+    if not address.mailbox or not address.host:
+        return None
+    return canonical_email('%s@%s' % (_text(address.mailbox), _text(address.host)))
+
+
+def parse_envelope(envelope, sent=False):
+    """
+    (name, email, subject) for one message, or None if the envelope can't be read
+    """
+    try:
+        if sent:
+            address = envelope.to[0]
+        else:
+            address = (envelope.reply_to or envelope.from_)[0]
+        email = address_email(address)
+    except (AttributeError, IndexError, TypeError) as e:
+        print("Error: " + str(e))
+        return None
+
+    if email is None:
+        return None
+
+    return _text(address.name), email, _text(envelope.subject).replace('\t', ' ')
+
+
+class _ConnectionPool:
+    """
+    One authenticated connection per worker thread, created on first use
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get(self):
+        server = getattr(self.local, 'server', None)
+        if server is None:
+            server = self.local.server = self.connect()
+            with self.lock:
+                self.connections.append(server)
+        return server
+
+    def close(self):
+        for server in self.connections:
+            try:
+                server.logout()
+            except Exception as e:
+                print("Error closing IMAP connection: " + str(e))
+        self.connections = []
+
+
+class Ingestor:
+    """
+    Pulls contacts out of IMAP folders into a writer, for example:
+
+        ingestor = Ingestor(imap_connect(), DEFAULT_FOLDERS)
+        with ContactWriter(CONTACTS_FILE) as writer:
+            ingestor.run(writer)
+
+    :param connect: returns a new, logged in IMAPClient (or a stand-in); called once per worker thread
+    :param folders: list of Folder(name, role)
+    :param parse: parse(envelope, sent) returns a (name, email, subject) row, or None to skip the message
+    :param dedup: write only the first row for each email in a run
+    """
+
+    def __init__(self, connect, folders=DEFAULT_FOLDERS, since=SINCE, workers=IMAP_WORKERS,
+                 batch_size=FETCH_BATCH_SIZE, checkpoint_path=CHECKPOINT_FILE, parse=parse_envelope,
+                 queue_size=10000, dedup=True):
+        self.connect = connect
+        self.folders = [Folder(*folder) for folder in folders]
+        self.since = since
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.parse = parse
+        self.queue_size = queue_size
+        self.dedup = dedup
+
+    def _sync_folder(self, pool, folder, checkpoints, put):
+        server = pool.get()
+        uidvalidity, uids = search_new(server, folder.name, checkpoints, self.since)
+        print('%d new messages in %s' % (len(uids), folder.name))
+
+        sent = folder.role == SENT
+        for uid, envelope in fetch_envelopes(server, uids, self.batch_size, folder.name):
+            row = self.parse(envelope, sent)
+            if row is not None:
+                put(('row', row))
+
+        put(('done', folder.name, uidvalidity, uids))
+
+    def run(self, writer):
+        """
+        Fetch the new messages of all folders in parallel and write their contacts to writer.
+        Returns the number of rows written.
+
+        Only the calling thread touches the writer and the checkpoint file; workers hand
+        rows over through a bounded queue, so a slow writer holds back the fetches instead of
+        letting rows pile up in memory. A folder's checkpoint is saved once all of its rows are on disk.
+        """
+        checkpoints = load_checkpoints(self.checkpoint_path)
+        rows = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        pool = _ConnectionPool(self.connect)
+        errors = []
+        written = 0
+        seen = set()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    rows.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+            raise RuntimeError('sync cancelled')
+
+        def sync(folder):
+            try:
+                self._sync_folder(pool, folder, checkpoints, put)
+            except Exception as e:
+                put(('error', folder.name, e))
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.folders))))
+        try:
+            for folder in self.folders:
+                executor.submit(sync, folder)
+
+            pending = len(self.folders)
+            while pending:
+                item = rows.get()
+                if item[0] == 'row':
+                    row = item[1]
+                    if self.dedup:
+                        # parse already canonicalized the email, so aliases collapse here too
+                        if row[1] in seen:
+                            continue
+                        seen.add(row[1])
+                    writer.write(row)
+                    written += 1
+                    continue
+
+                pending -= 1
+                if item[0] == 'done':
+                    _, folder, uidvalidity, uids = item
+                    # the rows must be on disk before the checkpoint says they were fetched
+                    writer.checkpoint()
+                    update_checkpoint(checkpoints, folder, uidvalidity, uids)
+                    save_checkpoints(checkpoints, self.checkpoint_path)
+                else:
+                    _, folder, e = item
+                    print('Error syncing %s: %s' % (folder, e))
+                    errors.append(e)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+            pool.close()
+
+        if errors:
+            raise errors[0]
+
+        return written
+
+
+def parse_folder(value):
+    """
+    'NAME' or 'NAME:sent' / 'NAME:received' on the command line
+    """
+    name, _, role = value.rpartition(':')
+    if role in (SENT, RECEIVED) and name:
+        return Folder(name, role)
+    return Folder(value, RECEIVED)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Log the contacts from new IMAP messages to a TSV file')
+    parser.add_argument('--folder', dest='folders', action='append', type=parse_folder,
+                        help='folder to sync as NAME[:sent|:received], repeatable (default: gmail sent, important and starred)')
+    parser.add_argument('--contacts-file', default=CONTACTS_FILE)
+    parser.add_argument('--store', help='upsert into this contact store (.db) instead of appending to --contacts-file')
+    parser.add_argument('--checkpoint-file', default=CHECKPOINT_FILE)
+    parser.add_argument('--since', type=lambda d: datetime.strptime(d, '%Y-%m-%d').date(), default=SINCE,
+                        help='oldest mail fetched for a folder without a checkpoint, YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=IMAP_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=FETCH_BATCH_SIZE)
+    parser.add_argument('--host', default=IMAP_HOST)
+    args = parser.parse_args(argv)
+
+    ingestor = Ingestor(imap_connect(args.host), args.folders or DEFAULT_FOLDERS, since=args.since,
+                        workers=args.workers, batch_size=args.batch_size, checkpoint_path=args.checkpoint_file)
+    if args.store:
+        writer = ContactStore(args.store)
+    else:
+        writer = ContactWriter(args.contacts_file)
+    with writer:
+        written = ingestor.run(writer)
+    print('%d contacts written to %s' % (written, writer.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 from warnings import warn
 
+import perf_lib
+
 
 def bnull(ser):
     """
@@ -10,13 +12,27 @@ def bnull(ser):
     Sometimes series of type Object will contain mixed types
     """
     if ser.dtype == np.dtype('O'):
-        # note: avoid astype(str) when using the value
-        return ser.isnull() | (ser.str.strip().astype(str) == '')
-        # it converts NaN to 'nan'
+        try:
+            # note: avoid astype(str) when using the value
+            return ser.isnull() | (ser.str.strip().astype(str) == '')
+            # it converts NaN to 'nan'
+        except AttributeError:
+            # no strings at all, e.g. bools with NaN from a merge
+            return ser.isnull()
     else:
         return ser.isnull()
 
 
+UNKNOWN_KEYS = ['pending', 'unknown', 'n/a', 'unavailable']
+
+
+def known_keys(df, on):
+    """
+    rows whose first merge column is neither blank nor a placeholder like 'unknown'
+    """
+    return df[~bnull(df[on[0]]) & ~df[on[0]].isin(UNKNOWN_KEYS)]
+
+
 def merge_overlapping(df1, df2, how='outer', on=[], prefer_right=[], label=''):
     """
     Merge two dataframes on the given merge columns
@@ -30,44 +46,145 @@ def merge_overlapping(df1, df2, how='outer', on=[], prefer_right=[], label=''):
         dt1 = df1[col].dtype
         dt2 = df2[col].dtype
 
-    # no matter if df2 should be uniqued or not, analyze the duplications in it
-    df2_uniq = df2.drop_duplicates(subset=on)
-
     # make sure the first of the merge cols is present (non-blank, and not unknown val) as this is normally the primary merge col
-    df2 = df2[~bnull(df2[on[0]]) & ~df2[on[0]].isin(
-        ['pending', 'unknown', 'n/a', 'unavailable'])]
+    df2 = known_keys(df2, on)
 
     if len(df1) == 0:
         return df1, df1, df1
     #
 
-    df = df1.merge(df2, how, on=on, indicator=False)
+    with perf_lib.stage('merge_overlapping', label, rows_in=len(df1) + len(df2)) as timing:
+        df = df1.merge(df2, how, on=on, indicator=False)
 
-    for col in shared_keys:
-        try:
-            if col in prefer_right:
-                # prefer the non-blank-or-null value; if both are bnull, prefer blank to null
-                prefer_right_mask = ~bnull(
-                    df[col + '_y']) | df[col + '_x'].isnull()
-
-                # this is application specific - sometimes we want to keep blank cols from the right
-                if enforce_right_col in df:
-                    prefer_right_mask |= df[enforce_right_col] == enforce_right_val
-                elif enforce_right_col + '_y' in df:
-                    prefer_right_mask |= df[enforce_right_col +
-                                            '_y'] == enforce_right_val
-
-                df[col] = np.where(prefer_right_mask,
-                                   df[col + '_y'],
-                                   df[col + '_x'])
-            else:
-                df[col] = np.where(~bnull(df[col + '_x']) | df[col + '_y'].isnull(),
-                                   df[col + '_x'],
-                                   df[col + '_y'])
-            df = df.drop([col + '_x', col + '_y'], axis=1)
-        except Exception as e:
-            warn('ERROR on shared key %s : %s' % (col, str(e)))
+        # coalesce every _x/_y pair into one new block, instead of assigning and dropping
+        # column by column, which copied the whole frame once per shared column
+        coalesced = {}
+        for col in shared_keys:
+            try:
+                left = df[col + '_x']
+                right = df[col + '_y']
+                if col in prefer_right:
+                    # prefer the non-blank-or-null value; if both are bnull, prefer blank to null
+                    coalesced[col] = coalesce(right, left)
+                else:
+                    coalesced[col] = coalesce(left, right)
+            except Exception as e:
+                warn('ERROR on shared key %s : %s' % (col, str(e)))
+
+        merged = [c for col in coalesced for c in (col + '_x', col + '_y')]
+        df = pd.concat([df.drop(merged, axis=1), pd.DataFrame(coalesced, index=df.index)], axis=1)
+        timing.add(rows_out=len(df))
 
     pd.set_option('display.max_colwidth', -1)
 
     return df
+
+
+def coalesce(left, right):
+    """
+    left where it is not blank, else right; blank is preferred to null
+    """
+    return np.where(~bnull(left) | right.isnull(), left, right)
+
+
+def merge_many(frames, on, how='outer', precedence=None):
+    """
+    Merge any number of dataframes on the merge columns in one pass, with the same values as
+    chaining merge_overlapping(merge_overlapping(frames[0], frames[1], ...), frames[2], ...).
+
+    The keys of all the frames are numbered once, and each output column is filled by taking
+    it from the frames that have it and coalescing them in precedence order: a list of
+    positions in frames, highest first, frames order by default; frames it leaves out come
+    after it, in frames order. Only one column at a time is being assembled on top of the output.
+
+    Keys are expected to be unique in each frame; if they are not, pairwise merges multiply the
+    rows and the frames are merged that way instead.
+    """
+    frames = [frames[0]] + [known_keys(df, on) for df in frames[1:]]
+    if precedence is None:
+        precedence = list(range(len(frames)))
+    else:
+        precedence = list(precedence)
+        if len(set(precedence)) < len(precedence) or not set(precedence) <= set(range(len(frames))):
+            raise ValueError('precedence must list distinct positions in frames, not %s' % (precedence,))
+        precedence += [i for i in range(len(frames)) if i not in precedence]
+
+    if len(frames[0]) == 0:
+        return frames[0]
+
+    with perf_lib.stage('merge_many', rows_in=sum(len(df) for df in frames)) as timing:
+        # number every distinct key in order of first appearance, like an outer merge orders them
+        all_keys = pd.concat([df[on] for df in frames if len(df)], ignore_index=True)
+        codes = all_keys.groupby(on, sort=False, dropna=False).ngroup().to_numpy()
+        groups = codes.max() + 1
+        offsets = np.cumsum([0] + [len(df) for df in frames if len(df)])
+        frame_codes = iter(np.split(codes, offsets[1:-1]))
+        frame_codes = [next(frame_codes) if len(df) else codes[:0] for df in frames]
+
+        if any(len(np.unique(c)) < len(c) for c in frame_codes):
+            df = frames[0]
+            for right in frames[1:]:
+                df = merge_overlapping(df, right, how=how, on=on)
+            return df
+
+        if how == 'outer':
+            output = np.arange(groups)
+        elif how == 'left':
+            output = frame_codes[0]
+        elif how == 'right':
+            output = frame_codes[-1]
+        elif how == 'inner':
+            output = frame_codes[0]
+            for c in frame_codes[1:]:
+                output = output[np.isin(output, c)]
+        else:
+            raise ValueError('how must be outer, left, right or inner, not %s' % how)
+
+        # where each output row is in each frame, -1 where it is missing
+        indexers = []
+        for c in frame_codes:
+            position = np.full(groups, -1)
+            position[c] = np.arange(len(c))
+            indexers.append(position[output])
+        if how == 'right':
+            # a row a later merge dropped takes nothing from the frames before it
+            kept = np.ones(len(output), dtype=bool)
+            for i in range(len(frames) - 2, -1, -1):
+                kept &= indexers[i + 1] >= 0
+                indexers[i] = np.where(kept, indexers[i], -1)
+
+        # output columns in the order the chained merges would leave them
+        columns = list(frames[0].columns)
+        for df in frames[1:]:
+            shared = sorted(set(columns).intersection(df.columns).difference(on))
+            columns = [c for c in columns if c not in shared]
+            columns += [c for c in df.columns if c not in on and c not in shared] + shared
+
+        first_seen = np.unique(codes, return_index=True)[1]
+        result = {c: all_keys[c].to_numpy()[first_seen[output]] for c in on}
+        for c in columns:
+            if c in on:
+                continue
+            values = blank = None
+            for i in precedence:
+                if c not in frames[i]:
+                    continue
+                indexer = indexers[i]
+                source = frames[i][c]
+                taken = pd.Series(pd.api.extensions.take(source.to_numpy(), indexer, allow_fill=True))
+                # blank and null masks of the source, taken along: cheaper than on the output rows.
+                # the True appended is what the -1s of missing rows pick
+                taken_blank = np.append(bnull(source).to_numpy(), True)[indexer]
+                if values is None:
+                    values, blank = taken, taken_blank
+                    continue
+                taken_null = np.append(source.isnull().to_numpy(), True)[indexer]
+                keep = ~blank | taken_null
+                values = pd.Series(np.where(keep, values, taken))
+                blank = np.where(keep, blank, taken_blank)
+            result[c] = values.to_numpy()
+
+        df = pd.DataFrame(result, columns=columns)
+        timing.add(rows_out=len(df))
+
+    return df
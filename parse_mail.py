@@ -1,17 +1,41 @@
 from sheets_lib import Sheet
-import sys
-import pandas as pd
+import argparse
 from merge_lib import merge_overlapping
+from rules_lib import CONTACT_RULES
+from resolve_lib import add_cluster_ids
+from contacts_lib import CHUNK_ROWS, ContactStore, canonical_email, is_store, read_contacts
 import os
+import perf_lib
 
 CONTACT_SHEET = os.environ.get('CONTACT_SHEET_SPECIFIC')
 
-contact_file = sys.argv[1]
+parser = argparse.ArgumentParser()
+parser.add_argument('contact_file', help='contacts TSV, or a contact store (.db)')
+parser.add_argument('--changed-only', action='store_true',
+                    help='with a contact store, only the contacts changed since the last --changed-only run')
+parser.add_argument('--stream', nargs='?', type=int, const=CHUNK_ROWS, metavar='CHUNK_ROWS',
+                    help='read and dedup a TSV in chunks, for files too big to load at once')
+parser.add_argument('--resolve', nargs='?', type=int, const=1, metavar='PROCESSES',
+                    help='add a cluster_id grouping contacts that look like the same person, '
+                         'optionally comparing in a pool of PROCESSES')
+args = parser.parse_args()
 
-df = pd.read_csv(contact_file, sep='\t')
-df = df.drop_duplicates('email')
+store = None
+with perf_lib.stage('read_contacts', args.contact_file) as timing:
+    if args.changed_only and is_store(args.contact_file):
+        store = ContactStore(args.contact_file)
+        until = store.latest_version()
+        df = store.to_dataframe(since=store.get_checkpoint('parse_mail'), until=until)
+    else:
+        df = read_contacts(args.contact_file, chunksize=args.stream)
+    timing.add(rows_out=len(df))
 
 df['name'] = df.name.fillna('')
+
+if args.resolve:
+    with perf_lib.stage('resolve', rows_in=len(df)) as timing:
+        df = add_cluster_ids(df, processes=args.resolve)
+        timing.add(rows_out=df.cluster_id.nunique())
 #df_no_null = df[df.name.notnull()].reset_index(drop=True)
 #df_nulls = df[df.name.isnull()].reset_index(drop=True)
 #df = pd.concat( [df_no_null, df_nulls])
@@ -21,13 +45,32 @@ sheet = Sheet(CONTACT_SHEET)
 ##############################################################################
 # Customize here for your purposes
 
-cw = sheet.get_as_dataframe('CivicWriters', 'A1', 'D200')
-cdf = df[df.subject.str.lower().str.contains(r'someone wants') | df.subject.str.lower(
-).str.contains(r'civic writers') | df.subject.str.lower().str.contains(r'write for democracy')]
-mdf = merge_overlapping(cw, cdf, on=['email'], how='outer')
-#mdf = pd.merge(cw, cdf, on=['email'], how='outer')
-sheet.upload('CivicWriters', mdf)
+# the tabs and their patterns are rules_lib.CONTACT_RULES, shared with sync.py
+RULES = CONTACT_RULES
+with perf_lib.stage('route', rows_in=len(df)) as timing:
+    routed = RULES.route(df)
+    timing.add(rows_out=sum(len(tab) for tab in routed.values()))
+
+cdf = routed['CivicWriters']
+if store is not None:
+    # only the contacts changed since the last run: add the ones the tab lacks below it,
+    # uploading a merge with part of the tab would drop the rows that weren't read
+    on_tab = sheet.load_many(['CivicWriters'], columns=['email'])['CivicWriters']
+    emails = {canonical_email(e) for e in on_tab.get('email', []) if e}
+    sheet.append('CivicWriters', cdf[~cdf.email.map(canonical_email).isin(emails)])
+else:
+    cw = sheet.get_as_dataframe('CivicWriters', 'A1', 'D200')
+    # the tab may hold emails typed or logged before they were canonicalized
+    cw['email'] = cw.email.map(canonical_email, na_action='ignore')
+    mdf = merge_overlapping(cw, cdf, on=['email'], how='outer')
+    #mdf = pd.merge(cw, cdf, on=['email'], how='outer')
+    sheet.upload('CivicWriters', mdf)
 
 ##############################################################################
 
+if store is not None:
+    # everything up to `until` is on the sheet now
+    store.set_checkpoint('parse_mail', until)
+    store.close()
+
 print("Visit https://docs.google.com/spreadsheets/d/%s" % CONTACT_SHEET)
@@ -0,0 +1,191 @@
+"""
+Timing of the hot paths: Sheets api calls, IMAP searches and fetches, and the pandas stages.
+
+Off unless FREECRM_PERF is set, and then a summary is written as JSON when the process exits,
+to the file FREECRM_PERF names, or to stdout for FREECRM_PERF=1. FREECRM_PROFILE=<file> also
+runs the main thread under cProfile and dumps the stats there (read them with pstats).
+FREECRM_PERF_MEMORY=1 on top of it starts tracemalloc, which slows allocation heavy code down,
+so that a pandas stage can report the peak of the memory Python allocated while it ran. The
+peak is process wide, so it is only recorded for stages that ran while no other stage did.
+
+    with perf_lib.span('imap', 'fetch', folder) as s:
+        response = server.fetch(...)
+        s.add(messages=len(response))
+
+When off, span returns one shared do nothing object, so an instrumented call costs a
+function call and an attribute check. Fields that are costly to compute should be
+guarded with `if perf_lib.ENABLED`.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+REPORT_FILE = os.environ.get('FREECRM_PERF') or None
+PROFILE_FILE = os.environ.get('FREECRM_PROFILE') or None
+ENABLED = bool(REPORT_FILE or PROFILE_FILE)
+MEMORY = bool(REPORT_FILE and os.environ.get('FREECRM_PERF_MEMORY'))
+
+# (kind, name, target) -> {'count', 'seconds', 'max_seconds', and a sum per added field}
+_stats = {}
+_lock = threading.Lock()
+_started = time.time()
+_profiler = None
+# stages running now, and the one whose memory peak is being measured
+_active_stages = 0
+_measuring = None
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+
+    def __init__(self, kind, name, target, fields):
+        self.key = (kind, name, target or '')
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.fields['errors'] = self.fields.get('errors', 0) + 1
+        record(*self.key, seconds=time.perf_counter() - self.start, **self.fields)
+        return False
+
+    def add(self, **fields):
+        for name, value in fields.items():
+            self.fields[name] = self.fields.get(name, 0) + value
+
+
+def span(kind, name, target=None, **fields):
+    """
+    context manager timing one call of `name` (an api method, 'fetch', a pandas stage)
+    on `target` (a tab, a folder); numbers passed in or add()ed are summed per key
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(kind, name, target, fields)
+
+
+class _Stage(Span):
+    """
+    a span that also notes the traced memory peak while it ran, when FREECRM_PERF_MEMORY is
+    on and no other stage, nested or in another thread, ran at the same time
+    """
+
+    def __enter__(self):
+        global _active_stages, _measuring
+        if MEMORY:
+            with _lock:
+                _active_stages += 1
+                if _active_stages == 1:
+                    _measuring = self
+                    tracemalloc.reset_peak()
+                else:
+                    # the peak would mix both stages' memory
+                    _measuring = None
+        return Span.__enter__(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active_stages, _measuring
+        if MEMORY:
+            with _lock:
+                _active_stages -= 1
+                if _measuring is self:
+                    self.fields['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+                    _measuring = None
+        return Span.__exit__(self, exc_type, exc_value, traceback)
+
+
+def stage(name, target=None, rows_in=0):
+    """
+    span for a pandas stage; add(rows_out=...) before it ends
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Stage('pandas', name, target, {'rows_in': rows_in})
+
+
+def record(kind, name, target='', seconds=0.0, **fields):
+    if not ENABLED:
+        return
+    with _lock:
+        stats = _stats.get((kind, name, target))
+        if stats is None:
+            stats = _stats[(kind, name, target)] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        for field, value in fields.items():
+            if field.startswith('peak_'):
+                stats[field] = max(stats.get(field, 0), value)
+            else:
+                stats[field] = stats.get(field, 0) + value
+
+
+def summary():
+    """
+    everything recorded so far, grouped by kind
+    """
+    with _lock:
+        items = sorted(_stats.items())
+    report = {'script': os.path.basename(sys.argv[0]), 'started': _started,
+              'wall_seconds': time.time() - _started}
+    for (kind, name, target), stats in items:
+        entry = dict(stats, name=name)
+        if target:
+            entry['target'] = target
+        report.setdefault(kind, []).append(entry)
+    return report
+
+
+def report(path=REPORT_FILE):
+    """
+    write the summary as JSON to path, or stdout for '1' or no path
+    """
+    text = json.dumps(summary(), indent=2, sort_keys=True, default=str)
+    if path and path != '1':
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        print('Performance summary written to %s' % path)
+    else:
+        print(text)
+
+
+def _finish():
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_FILE)
+        print('Profile written to %s' % PROFILE_FILE)
+    if REPORT_FILE:
+        report()
+
+
+if ENABLED:
+    if MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if PROFILE_FILE:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_finish)
@@ -1,15 +1,18 @@
 import pdb
 from sheets_lib import Sheet
 import sys
-import pandas as pd
 import os
+from contacts_lib import read_contacts
+import perf_lib
 
 CONTACT_SHEET = os.environ.get('CONTACT_SHEET')
 
 contact_file = sys.argv[1]
 
-df = pd.read_csv(contact_file, sep='\t')
-df = df.drop_duplicates('email')
+# a contacts TSV or a contact store (.db)
+with perf_lib.stage('read_contacts', contact_file) as timing:
+    df = read_contacts(contact_file)
+    timing.add(rows_out=len(df))
 
 df['name'] = df.name.fillna('')
 #df_no_null = df[df.name.notnull()].reset_index(drop=True)
@@ -0,0 +1,205 @@
+"""
+Entity resolution: group contacts that are likely the same person, e.g. one name with a work
+and a personal address, or one mailbox name at two domains.
+
+Candidates come from a sorted neighbourhood index. The contacts are sorted on a few keys
+(normalized name, name spelled backwards, email mailbox) and each is compared with the
+WINDOW contacts after it, so the work grows with n * WINDOW rather than n squared. Matches
+are merged with union-find, and a cluster's id is the smallest canonical email in it, so the
+ids don't move when the contacts are read in another order or a contact joins another cluster.
+"""
+
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from contacts_lib import canonical_email
+
+# contacts each one is compared with, per sort key
+WINDOW = int(os.environ.get('FREECRM_RESOLVE_WINDOW') or 10)
+# trigram similarity two full names need to count as the same person
+NAME_THRESHOLD = float(os.environ.get('FREECRM_RESOLVE_THRESHOLD') or 0.8)
+# mailboxes too common to say anything about who is behind them
+GENERIC_MAILBOXES = {'info', 'admin', 'contact', 'hello', 'office', 'team', 'support', 'mail', 'noreply',
+                     'no-reply', 'donotreply', 'sales', 'help', 'jobs', 'news', 'newsletter', 'notifications'}
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]|_')
+
+
+def normalize_name(name):
+    """
+    lower case, no accents or punctuation, tokens sorted: 'Smith, José' -> 'jose smith'
+    """
+    if not isinstance(name, str) or not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sorted(PUNCTUATION_RE.sub(' ', name.lower()).split()))
+
+
+def mailbox_key(email):
+    """
+    the mailbox without +tag or separators, '' for generic ones: 'J.Smith+crm@x.org' -> 'jsmith'
+    """
+    if not isinstance(email, str) or '@' not in email:
+        return ''
+    mailbox = email.rpartition('@')[0].lower().split('+', 1)[0]
+    if mailbox in GENERIC_MAILBOXES:
+        return ''
+    mailbox = re.sub(r'[._-]', '', mailbox)
+    return mailbox if len(mailbox) >= 4 else ''
+
+
+def trigrams(text):
+    text = ' %s ' % text
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(grams1, grams2, at_least=0.0):
+    """
+    jaccard similarity of two trigram sets, 0 without computing it when it can't reach at_least
+    """
+    size1, size2 = len(grams1), len(grams2)
+    if not size1 or not size2 or min(size1, size2) < at_least * max(size1, size2):
+        return 0.0
+    common = len(grams1 & grams2)
+    return common / float(size1 + size2 - common)
+
+
+def is_match(a, b, grams_a, grams_b, threshold=NAME_THRESHOLD):
+    """
+    a and b are (name, mailbox, full name?) records
+    """
+    name_a, mailbox_a, full_a = a
+    name_b, mailbox_b, full_b = b
+    if mailbox_a and mailbox_a == mailbox_b:
+        # same mailbox at another domain, unless the names say otherwise
+        return not (name_a and name_b) or similarity(grams_a, grams_b, 0.5) >= 0.5
+    if full_a and full_b:
+        # first and last name, a single given name says too little
+        return name_a == name_b or similarity(grams_a, grams_b, threshold) >= threshold
+    return False
+
+
+def window_pairs(records, positions, window=WINDOW, threshold=NAME_THRESHOLD):
+    """
+    (i, j) pairs of matching records among each of `positions` and the window - 1 after it
+    """
+    pairs = []
+    grams = {}
+    for n, i in enumerate(positions):
+        if i not in grams:
+            grams[i] = trigrams(records[i][0])
+        for j in positions[n + 1:n + window]:
+            if j not in grams:
+                grams[j] = trigrams(records[j][0])
+            if is_match(records[i], records[j], grams[i], grams[j], threshold):
+                pairs.append((i, j))
+        # only the window ahead is compared again
+        grams.pop(i)
+    return pairs
+
+
+def _window_pairs_chunk(args):
+    records, positions, window, threshold = args
+    # the chunk's records come numbered from 0, map them back to positions in the frame
+    pairs = window_pairs(records, list(range(len(records))), window, threshold)
+    return [(positions[i], positions[j]) for i, j in pairs]
+
+
+class UnionFind:
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            # the smaller root wins, so finds stay short on already merged clusters
+            if root_j < root_i:
+                root_i, root_j = root_j, root_i
+            self.parent[root_j] = root_i
+
+
+def sort_orders(records):
+    """
+    the sorted neighbourhood passes, each a list of record positions
+    """
+    n = len(records)
+    return [
+        sorted((i for i in range(n) if records[i][0]), key=lambda i: records[i][0]),
+        # a typo in the first letters moves a name far away in the first order
+        sorted((i for i in range(n) if records[i][0]), key=lambda i: records[i][0][::-1]),
+        sorted((i for i in range(n) if records[i][1]), key=lambda i: records[i][1]),
+    ]
+
+
+def resolve(df, name='name', email='email', window=WINDOW, threshold=NAME_THRESHOLD, processes=None):
+    """
+    Series of cluster ids, aligned with df: the smallest canonical email of each cluster, or for a
+    cluster without one, the position in df of its first contact as a string.
+    With processes, each sort order is split into that many chunks compared in a process pool.
+    """
+    names = [normalize_name(v) for v in df[name]]
+    records = [(n, mailbox_key(e), n.count(' ') >= 1) for n, e in zip(names, df[email])]
+    groups = UnionFind(len(records))
+
+    orders = sort_orders(records)
+    if processes and processes > 1:
+        jobs = []
+        for order in orders:
+            size = max(window, len(order) // processes + 1)
+            for start in range(0, len(order), size):
+                # overlap by window - 1 so pairs across the cut are compared too
+                chunk = order[start:start + size + window - 1]
+                jobs.append(([records[i] for i in chunk], chunk, window, threshold))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for pairs in executor.map(_window_pairs_chunk, jobs):
+                for i, j in pairs:
+                    groups.union(i, j)
+    else:
+        for order in orders:
+            for i, j in window_pairs(records, order, window, threshold):
+                groups.union(i, j)
+
+    roots = [groups.find(i) for i in range(len(records))]
+    ids = {}
+    for root, e in zip(roots, df[email]):
+        key = canonical_email(e) if isinstance(e, str) else ''
+        if key and (root not in ids or key < ids[root]):
+            ids[root] = key
+    return pd.Series([ids.get(root, str(root)) for root in roots], index=df.index, name='cluster_id')
+
+
+def add_cluster_ids(df, column='cluster_id', **kwargs):
+    """
+    df with a cluster id column, see resolve
+    """
+    df = df.copy()
+    df[column] = resolve(df, **kwargs)
+    clusters = df[column].nunique()
+    print('%d contacts in %d clusters' % (len(df), clusters))
+    return df
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    from contacts_lib import read_contacts
+
+    # python ./resolve_lib.py contacts.csv [processes]
+    contacts = read_contacts(sys.argv[1])
+    start = time.time()
+    resolved = add_cluster_ids(contacts, processes=int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print('resolved in %.1fs' % (time.time() - start))
@@ -0,0 +1,68 @@
+"""
+Declarative rules that route contacts to sheet tabs
+"""
+
+import re
+
+import pandas as pd
+
+
+class RuleSet:
+    """
+    Map of tab name to regex patterns per contact column, for example
+
+        RuleSet({
+            'CivicWriters': {'subject': [r'someone wants', r'civic writers']},
+            'Volunteers': {'subject': [r'volunteer'], 'email': [r'@volunteermatch\\.org$']},
+        })
+
+    A contact goes to every tab with a pattern matching any of its columns. Patterns are
+    matched against the lowercased column, so write them in lower case.
+
+    Each column is lowercased once however many tabs match on it, and each tab's patterns
+    on a column are joined into one alternation, so there is one vectorized scan per tab and column.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.tabs = list(rules)
+
+        # column -> [(tab, compiled alternation of its patterns)]
+        self.matchers = {}
+        for tab in self.tabs:
+            for column, patterns in rules[tab].items():
+                if isinstance(patterns, str):
+                    patterns = [patterns]
+                pattern = re.compile('|'.join('(?:%s)' % p for p in patterns))
+                self.matchers.setdefault(column, []).append((tab, pattern))
+
+    def match(self, df):
+        """
+        DataFrame of booleans with one column per tab, True where the contact belongs on that tab
+        """
+        hits = pd.DataFrame(False, index=df.index, columns=self.tabs)
+        for column, patterns in self.matchers.items():
+            if column not in df:
+                continue
+            values = df[column].fillna('').astype(str).str.lower()
+            for tab, pattern in patterns:
+                hits[tab] |= values.str.contains(pattern)
+        return hits
+
+    def route(self, df):
+        """
+        Split df into {tab: matching contacts}, printing the hit count of each rule
+        """
+        hits = self.match(df)
+        routed = {}
+        for tab in self.tabs:
+            routed[tab] = df[hits[tab]]
+            print('%d contacts match %s' % (len(routed[tab]), tab))
+        return routed
+
+
+# tab name -> patterns (lower case regexes) on subject, name or email.
+# Customize here for your purposes; parse_mail.py and sync.py route contacts with these
+CONTACT_RULES = RuleSet({
+    'CivicWriters': {'subject': [r'someone wants', r'civic writers', r'write for democracy']},
+})
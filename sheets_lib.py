@@ -7,11 +7,21 @@ import os
 from googleapiclient import discovery
 from googleapiclient.errors import HttpError
 import datetime
+import json
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+import perf_lib
+from merge_lib import bnull
 
-from merge_lib import merge_overlapping
-
-import pandas as pd
 import numpy as np
+import pandas as pd
 from oauth2client.service_account import ServiceAccountCredentials
 import string
 
@@ -24,6 +34,30 @@ if os.environ.get('socks_proxy'):
     socks.wrapmodule(httplib2)
 
 SCOPES = 'https://www.googleapis.com/auth/spreadsheets'
+CREDENTIALS_FILE = '.credentials_google_sheets_api.json'
+DISCOVERY_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+# the discovery document is downloaded once and read from here afterwards, delete it to refresh
+DISCOVERY_CACHE = os.environ.get('FREECRM_DISCOVERY_CACHE') or os.path.expanduser('~/.cache/freecrm/sheets_v4_discovery.json')
+DATE_FORMAT = '%Y-%m-%d'
+# what people typed on tabs, kept between runs by Sheet.preserve
+ANNOTATION_CACHE = os.environ.get('FREECRM_ANNOTATION_CACHE') or './.annotations'
+
+# uploads bigger than one chunk are written in row ranges, in parallel, to a staging tab
+UPLOAD_CHUNK_BYTES = int(os.environ.get('FREECRM_UPLOAD_CHUNK_BYTES') or 2 * 1024 * 1024)
+UPLOAD_CHUNK_CELLS = int(os.environ.get('FREECRM_UPLOAD_CHUNK_CELLS') or 100000)
+UPLOAD_WORKERS = int(os.environ.get('FREECRM_UPLOAD_WORKERS') or 4)
+
+# every api call goes through EXECUTOR, which keeps the process under the per user quota
+# and retries rate limit and server errors with exponential backoff
+REQUESTS_PER_MINUTE = float(os.environ.get('FREECRM_SHEETS_RPM') or 60)
+REQUEST_BURST = int(os.environ.get('FREECRM_SHEETS_BURST') or 10)
+MAX_RETRIES = int(os.environ.get('FREECRM_SHEETS_RETRIES') or 6)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# the only status a call that isn't safe to repeat (an append, adding a tab) is retried on:
+# the request was refused, so it did nothing. After a 5xx or a timeout it may have gone through
+RATE_LIMIT_STATUS = 429
+# the first quoted tab name in a request's url or body, for perf_lib
+TAB_RE = re.compile(r"'((?:[^']|'')+)'")
 
 
 def get_credentials():
@@ -36,7 +70,7 @@ def get_credentials():
         Credentials, the obtained credential.
     """
 
-    path = os.path.expanduser('.credentials_google_sheets_api.json')
+    path = os.path.expanduser(CREDENTIALS_FILE)
 
     if os.path.exists(path):
         credentials = ServiceAccountCredentials.from_json_keyfile_name(
@@ -48,14 +82,187 @@ def get_credentials():
     return credentials
 
 
+# credential file -> (credentials, service), shared by every Sheet in the process
+_services = {}
+_services_lock = threading.Lock()
+# per thread authorized http connections, by credential file
+_thread_local = threading.local()
+
+
+def get_discovery_document(path=DISCOVERY_CACHE):
+    """
+    The sheets v4 discovery document, from the disk cache; on the first call it is taken
+    from the copy bundled with googleapiclient if there is one, else downloaded, and saved there
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+
+    try:
+        # google-api-python-client 2.x ships the documents it knows about
+        from googleapiclient.discovery_cache import get_static_doc
+        content = get_static_doc('sheets', 'v4')
+    except ImportError:
+        content = None
+
+    if content is None:
+        resp, content = httplib2.Http().request(DISCOVERY_URL)
+        if resp.status != 200:
+            raise RuntimeError('Could not download %s: HTTP %s' % (DISCOVERY_URL, resp.status))
+        content = content.decode('utf-8')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return content
+
+
+def _get_service_entry():
+    path = os.path.expanduser(CREDENTIALS_FILE)
+    with _services_lock:
+        if path not in _services:
+            credentials = get_credentials()
+            http = credentials.authorize(httplib2.Http())
+            service = discovery.build_from_document(get_discovery_document(), http=http)
+            _services[path] = (credentials, service)
+        return path, _services[path]
+
+
 def get_service():
-    credentials = get_credentials()
+    """
+    The sheets service, created on first use and then shared process wide.
+    It is built from the disk cached discovery document, so no discovery round trip.
+    Threads other than the first should execute requests with http=get_http().
+    """
+    return _get_service_entry()[1][1]
+
+
+def get_http():
+    """
+    An authorized http connection for the calling thread, httplib2 connections are not thread safe
+    """
+    path, (credentials, _) = _get_service_entry()
+    https = _thread_local.__dict__.setdefault('https', {})
+    if path not in https:
+        https[path] = credentials.authorize(httplib2.Http())
+    return https[path]
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average and bursts of up to `capacity`, shared by all threads
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        take a token, waiting until one is due; returns the seconds waited
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # reserve the token now, so waiting threads queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
+        return wait
 
-    http = credentials.authorize(httplib2.Http())
-    discovery_url = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
-    service = discovery.build(
-        'sheets', 'v4', http=http, discoveryServiceUrl=discovery_url, cache_discovery=False)
-    return service
+
+def _request_text(request):
+    return unquote(getattr(request, 'uri', None) or ''), getattr(request, 'body', None) or ''
+
+
+def request_tab(request):
+    """
+    the tab a request is about, when its range names one
+    """
+    m = TAB_RE.search(''.join(_request_text(request)))
+    return m.group(1).replace("''", "'") if m else None
+
+
+def request_size(request):
+    return sum(len(text) for text in _request_text(request))
+
+
+def is_retryable(error, idempotent=True):
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRY_STATUSES if idempotent else error.resp.status == RATE_LIMIT_STATUS
+    return idempotent and isinstance(error, (socket.timeout, ConnectionError))
+
+
+class Executor:
+    """
+    Runs api requests through the rate limiter, retrying retryable errors with full jitter
+    exponential backoff, and counts calls, retries, errors and time per api method.
+    Pass idempotent=False for a request that must not run twice; it is only retried on a 429.
+    """
+
+    def __init__(self, limiter=None, max_retries=MAX_RETRIES, base_delay=1, max_delay=64,
+                 sleep=time.sleep, random=random.random):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.random = random
+        self.lock = threading.Lock()
+        # methodId -> {'calls', 'retries', 'errors', 'seconds', 'throttled'}
+        self.metrics = {}
+
+    def _count(self, method, **counts):
+        with self.lock:
+            metrics = self.metrics.setdefault(
+                method, {'calls': 0, 'retries': 0, 'errors': 0, 'seconds': 0.0, 'throttled': 0.0})
+            for name, value in counts.items():
+                metrics[name] += value
+
+    def execute(self, request, http=None, idempotent=True):
+        method = getattr(request, 'methodId', None) or type(request).__name__
+        attempt = 0
+        while True:
+            throttled = self.limiter.acquire() if self.limiter else 0
+            start = time.perf_counter()
+            try:
+                with perf_lib.span('sheets', method, request_tab(request) if perf_lib.ENABLED else None) as timing:
+                    result = request.execute(http=http) if http is not None else request.execute()
+                    if perf_lib.ENABLED:
+                        timing.add(request_bytes=request_size(request), response_bytes=len(json.dumps(result)),
+                                   throttled_seconds=throttled)
+            except Exception as e:
+                self._count(method, calls=1, throttled=throttled, seconds=time.perf_counter() - start)
+                if attempt >= self.max_retries or not is_retryable(e, idempotent):
+                    self._count(method, errors=1)
+                    raise
+                delay = self.random() * min(self.max_delay, self.base_delay * 2 ** attempt)
+                print('%s failed (%s), retry %d in %.1fs' % (method, e, attempt + 1, delay))
+                self._count(method, retries=1)
+                self.sleep(delay)
+                attempt += 1
+                continue
+            self._count(method, calls=1, throttled=throttled, seconds=time.perf_counter() - start)
+            return result
+
+    def report(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        for method, m in metrics:
+            print('%-45s %5d calls %3d retries %3d errors %7.2fs  %6.2fs throttled' % (
+                method, m['calls'], m['retries'], m['errors'], m['seconds'], m['throttled']))
+
+
+EXECUTOR = Executor(TokenBucket(REQUESTS_PER_MINUTE / 60.0, REQUEST_BURST))
 
 
 def clear(spreadsheet_id, sheet_name):
@@ -64,8 +271,193 @@ def clear(spreadsheet_id, sheet_name):
 
     # clear this sheet first
     # use A:Z to clear all the cells
-    service.spreadsheets().values().clear(
-        spreadsheetId=spreadsheet_id, range="'%s'!A:Z" % sheet_name, body={}).execute()
+    EXECUTOR.execute(service.spreadsheets().values().clear(
+        spreadsheetId=spreadsheet_id, range="'%s'!A:Z" % sheet_name, body={}), http=get_http())
+
+
+def column_letter(index):
+    """
+    A1 notation column for a 0 based column index: 0 -> A, 25 -> Z, 26 -> AA
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = string.ascii_uppercase[remainder] + letters
+    return letters
+
+
+def _cell_str(value):
+    """
+    a cell as text, so values written from a dataframe compare equal to the same values read back
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _serialize_column(ser):
+    """
+    one column as a list of json friendly cell values, converted by dtype rather than cell by cell
+    """
+    kind = ser.dtype.kind
+
+    if kind == 'M':
+        # datetime64 columns, with or without a timezone
+        return ser.dt.strftime(DATE_FORMAT).fillna('').tolist()
+    if not isinstance(ser.dtype, np.dtype) and kind in 'biuf':
+        # nullable Int64, boolean and Float64: pd.NA for blanks and numpy scalars from astype(object)
+        values = ser.astype(object).where(ser.notna(), '')
+        return [v.item() if isinstance(v, np.generic) else v for v in values]
+    if kind in 'biu':
+        # tolist gives python ints and bools, not numpy scalars
+        return ser.tolist()
+    if kind == 'f':
+        return ser.astype(object).where(ser.notnull(), '').tolist()
+
+    inferred = pd.api.types.infer_dtype(ser, skipna=True)
+    if inferred in ('date', 'datetime', 'datetime64') or (
+            inferred == 'mixed' and any(isinstance(v, datetime.date) for v in ser)):
+        return pd.to_datetime(ser).dt.strftime(DATE_FORMAT).fillna('').tolist()
+    if kind == 'm':
+        ser = ser.astype(str).where(ser.notnull(), '')
+
+    ser = ser.astype(object)
+    return ser.where(ser.notnull(), '').tolist()
+
+
+def serialize_frame(df):
+    """
+    Header and rows of df for the values api: blanks for NaN/None/NaT, dates as
+    DATE_FORMAT strings, numpy numbers as python numbers. df itself is not modified.
+    """
+    columns = [_serialize_column(df.iloc[:, i]) for i in range(df.shape[1])]
+    return df.columns.tolist(), [list(row) for row in zip(*columns)]
+
+
+def chunk_rows(rows, max_bytes=UPLOAD_CHUNK_BYTES, max_cells=UPLOAD_CHUNK_CELLS):
+    """
+    Split rows into (start index, rows) chunks that each stay under the byte and cell budgets.
+    Chunks are cut on the cell count first. Their byte size, the json length that they cost in
+    the request body, is estimated from a sample of rows and only measured for a chunk near the
+    byte budget, which is halved until it fits.
+    """
+    chunks = []
+    start = 0
+    while start < len(rows):
+        end = start + 1
+        cells = len(rows[start])
+        while end < len(rows) and cells + len(rows[end]) <= max_cells:
+            cells += len(rows[end])
+            end += 1
+        _split_on_bytes(rows, start, end, max_bytes, chunks)
+        start = end
+    return chunks
+
+
+def _split_on_bytes(rows, start, end, max_bytes, chunks):
+    count = end - start
+    sample = rows[start:end:max(1, count // 100)]
+    estimate = len(json.dumps(sample, default=str)) * count / len(sample)
+    if count > 1 and estimate > max_bytes:
+        # pieces that should come out at about three quarters of the budget, each checked again
+        parts = min(count, int(estimate / (max_bytes * 0.75)) + 1)
+        bounds = [start + count * k // parts for k in range(parts + 1)]
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            _split_on_bytes(rows, piece_start, piece_end, max_bytes, chunks)
+    elif count > 1 and estimate > max_bytes * 0.75 and len(json.dumps(rows[start:end], default=str)) > max_bytes:
+        middle = (start + end) // 2
+        _split_on_bytes(rows, start, middle, max_bytes, chunks)
+        _split_on_bytes(rows, middle, end, max_bytes, chunks)
+    else:
+        chunks.append((start, rows[start:end]))
+
+
+def cell_position(cell):
+    """
+    0 based (row, column) of an A1 cell: 'A1' -> (0, 0), 'AB12' -> (11, 27)
+    """
+    letters = cell.rstrip(string.digits)
+    column = 0
+    for letter in letters.upper():
+        column = column * 26 + string.ascii_uppercase.index(letter) + 1
+    return int(cell[len(letters):]) - 1, column - 1
+
+
+class TabIndex:
+    """
+    Hash indexes over a tab's labels as the tab shows them (the formatted values, so a
+    2019 or a formula matches its text): column label -> column, and lowercased
+    first column label -> the rows (0 based, header is row 0) that carry it
+    """
+
+    def __init__(self, header, first_column):
+        self.columns = {}
+        for i, label in enumerate(header):
+            self.columns.setdefault(_cell_str(label), i)
+
+        self.row_labels = {}
+        for i, label in enumerate(first_column[1:], 1):
+            if label != '':
+                self.row_labels.setdefault(_cell_str(label).lower(), []).append(i)
+
+
+def frame_from_rows(values, fill=None, width=None):
+    """
+    DataFrame from the ragged rows the values api returns, first row the header.
+    pandas pads the short rows itself, with None, or with `fill` if given.
+    The frame is `width` columns wide if given, else as wide as the widest row.
+    """
+    if not values:
+        return pd.DataFrame()
+    df = pd.DataFrame(values)
+    if width is not None:
+        df = df.reindex(columns=range(width))
+    if fill is not None:
+        df = df.fillna(fill)
+    header = df.iloc[0].tolist()
+    df = df.iloc[1:].reset_index(drop=True).infer_objects()
+    df.columns = header
+    return df
+
+
+def a1_range(title):
+    """
+    quoted A1 range for a tab title, or for 'title!A1:D200'
+    """
+    tab, sep, cells = title.partition('!')
+    return "'%s'%s%s" % (tab, sep, cells)
+
+
+def row_key_strings(df, keys):
+    """
+    the key columns of each row as one string, the cell texts joined with tabs
+    """
+    row_keys = df[keys[0]].map(_cell_str)
+    for k in keys[1:]:
+        row_keys = row_keys + '\t' + df[k].map(_cell_str)
+    return row_keys
+
+
+def annotation_cache_path(cache_dir, doc_id, title):
+    return os.path.join(cache_dir, '%s_%s.json' % (doc_id, re.sub(r'[^\w.-]', '_', title)))
+
+
+def load_annotations(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_annotations(annotations, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(annotations, f)
+    os.replace(tmp_path, path)
 
 
 def hyperlink(href, text):
@@ -85,11 +477,97 @@ class Sheet:
     number_format = {'type': 'NUMBER', 'pattern': '#,#'}
     percent_format = {'type': 'PERCENT', 'pattern': '##.00%'}
 
-    def __init__(self, doc_id):
+    def __init__(self, doc_id, service=None, executor=None):
         self.doc_id = doc_id
-        self.service = get_service()
-        self.sheet_metadata = self.service.spreadsheets().get(
-            spreadsheetId=self.doc_id).execute()
+        # a service passed in, a test double for example, executes requests on its own http
+        self._shared_service = service is None
+        self.service = get_service() if service is None else service
+        self.executor = EXECUTOR if executor is None else executor
+        self.sheet_metadata = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=self.doc_id))
+        # title -> the tab's rows as of this Sheet's last upload to it or read of its grid (FORMULA
+        # render), kept up to date by this Sheet's own writes
+        self._snapshots = {}
+        # title -> TabIndex of the tab's labels, read on first label lookup
+        self._indexes = {}
+        # (requests, value ranges) collected inside a `with sheet.batch():` block
+        self._batch = None
+
+    def _execute(self, request, idempotent=True):
+        """
+        every request of this Sheet goes through here, on this thread's http connection
+        """
+        return self.executor.execute(request, http=get_http() if self._shared_service else None,
+                                     idempotent=idempotent)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the formatting requests and update_cell writes made inside the block and send
+        them as one batchUpdate plus one values batchUpdate when it exits:
+
+            with sheet.batch():
+                for i in range(20):
+                    sheet.format_as_currency('report', i)
+
+        Reads (including the check update_cell makes first) and uploads still go out right away,
+        so a tab added inside the block only exists after it. Nothing is sent if the block raises.
+        Nested blocks join the outer one.
+        """
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = batch = ([], [])
+        try:
+            yield self
+        except BaseException:
+            # KeyboardInterrupt and GeneratorExit too: the queue is dropped, not sent
+            del batch[0][:], batch[1][:]
+            # queued update_cell writes were already applied to the cached snapshots
+            self.refresh()
+            raise
+        finally:
+            self._batch = None
+
+        requests, data = batch
+        if requests:
+            self._batch_update(requests)
+        if data:
+            self._execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.doc_id, body={'valueInputOption': 'USER_ENTERED', 'data': data}))
+
+    def _batch_update(self, requests):
+        """
+        spreadsheets().batchUpdate, or queue the requests when inside a batch() block
+        """
+        if self._batch is not None:
+            self._batch[0].extend(requests)
+            return None
+
+        # a repeated addSheet would fail, or add a second tab
+        reply = self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.doc_id, body={'requests': requests}),
+            idempotent=not any('addSheet' in r or 'duplicateSheet' in r for r in requests))
+
+        if any('addSheet' in r or 'deleteSheet' in r for r in requests):
+            # keep get_sheet_id right for tabs added or removed here
+            self.sheet_metadata = self._execute(self.service.spreadsheets().get(spreadsheetId=self.doc_id))
+        return reply
+
+    def _values_update(self, cell_range, values):
+        """
+        values().update, or queue the range when inside a batch() block
+        """
+        if self._batch is not None:
+            self._batch[1].append({'range': cell_range, 'values': values})
+            return
+
+        self._execute(self.service.spreadsheets().values().update(
+            spreadsheetId=self.doc_id,
+            range=cell_range,
+            valueInputOption='USER_ENTERED',
+            body={'values': values}))
 
     def copy_to(self, title, destination_doc_id):
         """
@@ -104,36 +582,54 @@ class Sheet:
 
         request = self.service.spreadsheets().sheets().copyTo(spreadsheetId=self.doc_id, sheetId=sheet_id,
                                                               body=copy_sheet_to_another_spreadsheet_request_body)
-        request.execute()
+        # each copy is a new tab in the destination
+        self._execute(request, idempotent=False)
 
     def load(self, title):
-        # clear this sheet first
-        resp = self.service.spreadsheets().values().get(
-            spreadsheetId=self.doc_id, range="'%s'" % title).execute()
-
-        if 'values' in resp:
-            values = resp['values']
-
-            width = 0
-
-            for row in values:
-                if len(row) > width:
-                    width = len(row)
+        return self.load_many([title])[title]
 
-            # fill blank with None
-            adjusted_content = []
-            for row in values:
-                length_diff = width - len(row)
-                row += [None] * length_diff
-                adjusted_content.append(row)
-
-            header = adjusted_content[0]
-            content = adjusted_content[1:]
-            df = pd.DataFrame(content, columns=header)
+    def load_many(self, titles, columns=None, value_render=None, fill=None):
+        """
+        {title: DataFrame} for several tabs, or ranges like 'title!A1:D200', read in one batchGet.
+        Short rows are padded with None, or with `fill`.
 
-            return df
-        else:
-            return pd.DataFrame()
+        With `columns`, a list of header labels, only those columns are fetched: one batchGet
+        for the header rows, then one for the matching columns of every tab. Labels a tab does
+        not have are left out of its frame, and rows are counted down to the last one with a
+        value in a fetched column.
+        """
+        kwargs = {'valueRenderOption': value_render} if value_render else {}
+        if columns is None:
+            ranges = [a1_range(title) for title in titles]
+            value_ranges = self._batch_get(ranges, **kwargs)
+            return {title: frame_from_rows(vr.get('values', []), fill)
+                    for title, vr in zip(titles, value_ranges)}
+
+        headers = self._batch_get(["'%s'!1:1" % title for title in titles], **kwargs)
+        ranges = []
+        for title, vr in zip(titles, headers):
+            header = (vr.get('values') or [[]])[0]
+            for column in columns:
+                if column in header:
+                    letter = column_letter(header.index(column))
+                    ranges.append((title, column, "'%s'!%s:%s" % (title, letter, letter)))
+
+        frames = {title: pd.DataFrame() for title in titles}
+        value_ranges = self._batch_get([r for _, _, r in ranges], majorDimension='COLUMNS', **kwargs) if ranges else []
+        by_title = {}
+        for (title, column, _), vr in zip(ranges, value_ranges):
+            values = (vr.get('values') or [[column]])[0][1:]
+            by_title.setdefault(title, {})[column] = pd.Series(values, dtype=object)
+        for title, cols in by_title.items():
+            # columns come back trimmed at their last value, pandas aligns them on the index
+            frame = pd.DataFrame(cols)
+            frames[title] = frame.where(frame.notnull(), fill).infer_objects()
+        return frames
+
+    def _batch_get(self, ranges, **kwargs):
+        resp = self._execute(self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.doc_id, ranges=ranges, **kwargs))
+        return resp.get('valueRanges', [])
 
     def message(self, title, message):
         """
@@ -144,19 +640,14 @@ class Sheet:
 
     def get_as_dataframe(self, title, from_cell, to_cell):
         arr_list = self.get_all_values(title, from_cell, to_cell)
-        columns = arr_list[0]
-        arr_list = arr_list[1:]
-        for j in range(0, len(arr_list)):
-            pad_num = len(columns) - len(arr_list[j])
-            arr_list[j] = arr_list[j] + [''] * pad_num
-        return pd.DataFrame(arr_list, columns=columns)
+        return frame_from_rows(arr_list, fill='', width=len(arr_list[0]))
 
     def get_all_values(self, title, from_cell, to_cell):
         request = self.service.spreadsheets().values().get(
             spreadsheetId=self.doc_id,
             range="'%s'!%s:%s" % (title, from_cell, to_cell),
             valueRenderOption="UNFORMATTED_VALUE")
-        response = request.execute()
+        response = self._execute(request)
         return response.get('values', None)
 
     def get_cell_value(self, title, cell_range):
@@ -164,28 +655,37 @@ class Sheet:
             spreadsheetId=self.doc_id,
             range="'%s'!%s:%s" % (title, cell_range, cell_range),
             valueRenderOption='UNFORMATTED_VALUE')
-        response = request.execute()
+        response = self._execute(request)
         if 'values' in response:
             return response['values'][0][0]
         else:
             return None
 
-    def update_cell(self, title, cell_range, value):
+    def _cached_cell(self, title, row, column):
+        rows = self._snapshots.get(title)
+        if rows is None:
+            # one read of the grid serves the checks of every later update_cell on the tab
+            rows = self._snapshots[title] = self._read_grid(title)
+        if row < len(rows) and column < len(rows[row]) and rows[row][column] != '':
+            return rows[row][column]
+        return None
 
-        body = {
-            'values': [
-                [value]
-            ]
-        }
+    def update_cell(self, title, cell_range, value):
 
-        existing = self.get_cell_value(title, cell_range)
+        row, column = cell_position(cell_range)
+        existing = self._cached_cell(title, row, column)
 
         if existing is None:
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.doc_id,
-                range="'%s'!%s:%s" % (title, cell_range, cell_range),
-                valueInputOption='USER_ENTERED',
-                body=body).execute()
+            self._values_update("'%s'!%s:%s" % (title, cell_range, cell_range), [[value]])
+
+            rows = self._snapshots[title]
+            while len(rows) <= row:
+                rows.append([])
+            rows[row] = list(rows[row]) + [''] * (column + 1 - len(rows[row]))
+            rows[row][column] = value
+            if row == 0 or column == 0:
+                # a label changed
+                self._indexes.pop(title, None)
         elif existing != value:
             print("Error")
 
@@ -206,50 +706,30 @@ class Sheet:
 
         sheet_id = self.get_sheet_id(title)
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {'repeatCell': {
-                        'range': {'sheetId': sheet_id,
-                                  "startColumnIndex": column_index, "endColumnIndex": column_index + 1,
-                                  "startRowIndex": row_index, "endRowIndex": row_index + 1,
-                                  },
-                        'cell': {'userEnteredFormat': {'numberFormat': format}},
-                        'fields': 'userEnteredFormat.numberFormat',
-                    }}
-                ]
-            }).execute()
+        self._batch_update([
+            {'repeatCell': {
+                'range': {'sheetId': sheet_id,
+                          "startColumnIndex": column_index, "endColumnIndex": column_index + 1,
+                          "startRowIndex": row_index, "endRowIndex": row_index + 1,
+                          },
+                'cell': {'userEnteredFormat': {'numberFormat': format}},
+                'fields': 'userEnteredFormat.numberFormat',
+            }}
+        ])
 
     def upload(self, title, df):
 
         print('Posting to Google Sheet [%s]' % title)
-        for col in df.keys():
-            try:
-                df[col] = df[col].fillna('')
-            except:
-                pass
-        df = df.copy()
 
         if len(df) == 0:
             return self.message(title, "There are no rows here.")
 
-        # convert date object into string object for google sheet api
-        for column in df.columns:
-
-            # if column == 'election_date':
-            #     import pdb
-            #     pdb.set_trace()
-
-            for i in range(len(df)):
-                value = df[column].iloc[i]
-                if isinstance(value, datetime.date):
-                    print('Convert column %s into string' % column)
-                    df[column] = pd.to_datetime(df[column]).dt.strftime(
-                        '%Y-%m-%d').str.replace('NaT', '')
-                    break
+        header, values = serialize_frame(df)
+        headers = [header]
 
-        headers = [df.columns.tolist()]
-        values = df.values.tolist()
+        chunks = chunk_rows(headers + values)
+        if len(chunks) > 1:
+            return self._upload_staged(title, headers + values, chunks)
 
         data = [
             {
@@ -264,35 +744,274 @@ class Sheet:
         }
 
         # clear this sheet first
-        self.service.spreadsheets().values().clear(
-            spreadsheetId=self.doc_id, range="'%s'" % title, body={}).execute()
+        self._execute(self.service.spreadsheets().values().clear(
+            spreadsheetId=self.doc_id, range="'%s'" % title, body={}))
 
         # then fill values
-        self.service.spreadsheets().values().batchUpdate(
-            spreadsheetId=self.doc_id, body=body).execute()
+        self._execute(self.service.spreadsheets().values().batchUpdate(
+            spreadsheetId=self.doc_id, body=body))
+        self._set_snapshot(title, headers + values)
 
         sheet_id = self.get_sheet_id(title)
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    # lock first line
-                    {'updateSheetProperties': {
-                        'properties': {'sheetId': sheet_id, 'gridProperties': {'frozenRowCount': 1}},
-                        'fields': 'gridProperties.frozenRowCount',
-                    }},
-
-                    # bold first line
-                    {'repeatCell': {
-                        'range': {'sheetId': sheet_id, "startRowIndex": 0, "endRowIndex": 1},
-                        'cell': {'userEnteredFormat': {'textFormat': {'bold': True}}},
-                        'fields': 'userEnteredFormat.textFormat.bold',
-                    }}
-                ]
-            }).execute()
+        self._batch_update(self._header_format_requests(sheet_id))
 
         print('Google Sheet [%s] updated' % title)
 
+    def _header_format_requests(self, sheet_id):
+        return [
+            # lock first line
+            {'updateSheetProperties': {
+                'properties': {'sheetId': sheet_id, 'gridProperties': {'frozenRowCount': 1}},
+                'fields': 'gridProperties.frozenRowCount',
+            }},
+
+            # bold first line
+            {'repeatCell': {
+                'range': {'sheetId': sheet_id, "startRowIndex": 0, "endRowIndex": 1},
+                'cell': {'userEnteredFormat': {'textFormat': {'bold': True}}},
+                'fields': 'userEnteredFormat.textFormat.bold',
+            }}
+        ]
+
+    def _upload_staged(self, title, rows, chunks, max_workers=UPLOAD_WORKERS):
+        """
+        Write rows that are too big for one request: the chunks go to a fresh staging tab in
+        parallel, then a single batchUpdate clears the real tab, pastes the staging tab over it
+        and deletes the staging tab. A batchUpdate is applied all or nothing, so readers see
+        either the old rows or the new ones, and a failed chunk leaves the real tab untouched.
+        """
+        staging_title = '%s__staging' % title
+        width = max(len(row) for row in rows)
+        target = self._sheet_properties(title)
+        if target is None:
+            self.add_sheet(title)
+            self.sheet_metadata = self._execute(self.service.spreadsheets().get(spreadsheetId=self.doc_id))
+            target = self._sheet_properties(title)
+        target_id = target['sheetId']
+
+        requests = []
+        stale = self._sheet_properties(staging_title)
+        if stale is not None:
+            # left behind by a run that failed before the swap
+            requests.append({'deleteSheet': {'sheetId': stale['sheetId']}})
+        requests.append({'addSheet': {'properties': {
+            'title': staging_title, 'hidden': True,
+            'gridProperties': {'rowCount': len(rows), 'columnCount': width},
+        }}})
+        reply = self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.doc_id, body={'requests': requests}), idempotent=False)
+        staging_id = reply['replies'][-1]['addSheet']['properties']['sheetId']
+
+        def write_chunk(chunk):
+            start, part = chunk
+            self._execute(self.service.spreadsheets().values().update(
+                spreadsheetId=self.doc_id, range="'%s'!A%d" % (staging_title, start + 1),
+                valueInputOption='USER_ENTERED', body={'values': part}))
+
+        print('Writing %d rows to [%s] in %d chunks' % (len(rows), staging_title, len(chunks)))
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(write_chunk, chunks))
+        except Exception:
+            self._execute(self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.doc_id, body={'requests': [{'deleteSheet': {'sheetId': staging_id}}]}))
+            raise
+
+        grid = target.get('gridProperties', {})
+        span = {'startRowIndex': 0, 'endRowIndex': len(rows), 'startColumnIndex': 0, 'endColumnIndex': width}
+        swap = [
+            # make room on the real tab, it never shrinks here
+            {'updateSheetProperties': {
+                'properties': {'sheetId': target_id, 'gridProperties': {
+                    'rowCount': max(grid.get('rowCount', 0), len(rows)),
+                    'columnCount': max(grid.get('columnCount', 0), width),
+                }},
+                'fields': 'gridProperties.rowCount,gridProperties.columnCount',
+            }},
+            # clear the old values, keeping formats and validation
+            {'updateCells': {'range': {'sheetId': target_id}, 'fields': 'userEnteredValue'}},
+            {'copyPaste': {
+                'source': dict(span, sheetId=staging_id),
+                'destination': dict(span, sheetId=target_id),
+                'pasteType': 'PASTE_FORMULA',
+            }},
+            {'deleteSheet': {'sheetId': staging_id}},
+        ] + self._header_format_requests(target_id)
+
+        self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.doc_id, body={'requests': swap}))
+        self.sheet_metadata = self._execute(self.service.spreadsheets().get(spreadsheetId=self.doc_id))
+        self._set_snapshot(title, rows)
+
+        print('Google Sheet [%s] updated' % title)
+
+    def _set_snapshot(self, title, rows):
+        self._snapshots[title] = rows
+        self._indexes.pop(title, None)
+
+    def _tab_index(self, title):
+        index = self._indexes.get(title)
+        if index is None:
+            # the header row and the first column, formatted like load() reads them
+            header, first_column = self._batch_get(["'%s'!1:1" % title, "'%s'!A:A" % title])
+            index = self._indexes[title] = TabIndex(
+                (header.get('values') or [[]])[0], [row[0] if row else '' for row in first_column.get('values', [])])
+        return index
+
+    def refresh(self, title=None):
+        """
+        Forget the cached contents of a tab (or all tabs), to see edits made outside this Sheet
+        """
+        if title is None:
+            self._snapshots.clear()
+            self._indexes.clear()
+        else:
+            self._snapshots.pop(title, None)
+            self._indexes.pop(title, None)
+
+    def _read_grid(self, title):
+        """
+        the tab's rows as upload_diff compares them: formulas as written, numbers unformatted
+        """
+        resp = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.doc_id, range="'%s'" % title,
+            valueRenderOption='FORMULA', dateTimeRenderOption='FORMATTED_STRING'))
+        return resp.get('values', [])
+
+    def append(self, title, df):
+        """
+        Add df's rows below the last row of the tab, in the order of the tab's header columns;
+        columns the tab has and df has not are left blank, columns df has and the tab has not
+        are dropped. An empty tab is uploaded to, header and all.
+
+        Returns the number of rows appended.
+        """
+        if len(df) == 0:
+            return 0
+
+        if title in self._snapshots:
+            header = self._snapshots[title][0] if self._snapshots[title] else []
+        else:
+            header = (self._batch_get(["'%s'!1:1" % title])[0].get('values') or [[]])[0]
+        if not header:
+            self.upload(title, df)
+            return len(df)
+
+        columns = [_serialize_column(df[c]) if c in df else [''] * len(df) for c in header]
+        rows = [list(row) for row in zip(*columns)]
+        self._execute(self.service.spreadsheets().values().append(
+            spreadsheetId=self.doc_id, range="'%s'!A1" % title, valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS', body={'values': rows}), idempotent=False)
+
+        if title in self._snapshots:
+            self._snapshots[title].extend(rows)
+            self._indexes.pop(title, None)
+
+        print('%d rows appended to Google Sheet [%s]' % (len(rows), title))
+        return len(rows)
+
+    def upload_diff(self, title, df, key, use_snapshot=True):
+        """
+        Like upload, but only write the rows that differ from what is on the tab, matched on the key column.
+
+        Rows already on the tab keep their place, contacts with new keys are appended at the bottom
+        and rows whose key is no longer in df are deleted with deleteDimension requests, so the
+        rows below them move up without being rewritten. Then the rows that changed go out in one
+        values batchUpdate, and the header formatting is left alone.
+        The tab is compared with the snapshot of the last upload from this Sheet if there is one,
+        otherwise it is read first. Falls back to a full upload when the header changed.
+
+        Returns the number of cells written.
+        """
+        if len(df) == 0 or key not in df or df[key].duplicated().any():
+            self.upload(title, df)
+            return sum(len(row) for row in self._snapshots.get(title, []))
+
+        header, values = serialize_frame(df)
+
+        current = self._snapshots.get(title) if use_snapshot else None
+        if current is None:
+            current = self._read_grid(title)
+
+        if not current or [_cell_str(c) for c in current[0]] != [_cell_str(c) for c in header]:
+            print('Header of [%s] changed, uploading all rows' % title)
+            self.upload(title, df)
+            return (len(values) + 1) * len(header)
+
+        k = header.index(key)
+        new_rows = {_cell_str(row[k]): row for row in values}
+
+        # rows whose key is gone, or seen higher up, are deleted; the others stay in their order
+        survivors = [current[0]]
+        ordered = []
+        deleted = []
+        for i, row in enumerate(current[1:], 1):
+            row_key = _cell_str(row[k]) if k < len(row) else ''
+            if row_key in new_rows and row_key not in ordered:
+                ordered.append(row_key)
+                survivors.append(row)
+            else:
+                deleted.append(i)
+        seen = set(ordered)
+        for row_key in new_rows:
+            if row_key not in seen:
+                ordered.append(row_key)
+        target = [header] + [new_rows[row_key] for row_key in ordered]
+
+        if deleted:
+            self._delete_rows(title, deleted)
+
+        width = max(len(row) for row in survivors + target)
+
+        def cells(grid, i):
+            row = grid[i] if i < len(grid) else []
+            return [_cell_str(c) for c in row] + [''] * (width - len(row))
+
+        # contiguous runs of changed rows, compared with the rows left after the deletes
+        data = []
+        start = None
+        for i in range(len(target) + 1):
+            changed = i < len(target) and cells(target, i) != cells(survivors, i)
+            if changed and start is None:
+                start = i
+            elif not changed and start is not None:
+                data.append({
+                    'range': "'%s'!A%d:%s%d" % (title, start + 1, column_letter(width - 1), i),
+                    'values': [list(target[j]) + [''] * (width - len(target[j])) for j in range(start, i)],
+                })
+                start = None
+
+        written = sum(len(d['values']) * width for d in data)
+        if data:
+            self._execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.doc_id, body={'valueInputOption': 'USER_ENTERED', 'data': data}))
+        self._set_snapshot(title, target)
+
+        print('Google Sheet [%s] updated, %d rows deleted, %d cells in %d ranges written' % (
+            title, len(deleted), written, len(data)))
+        return written
+
+    def _delete_rows(self, title, rows):
+        """
+        delete the rows (0 based, ascending) of a tab in one batchUpdate, a request per run of rows
+        """
+        runs = []
+        for i in rows:
+            if runs and runs[-1][1] == i:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+        sheet_id = self.get_sheet_id(title)
+        # bottom up, so each range is still where it was when the rows were numbered
+        requests = [{'deleteDimension': {'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                                                   'startIndex': start, 'endIndex': end}}}
+                    for start, end in reversed(runs)]
+        # sent right away even inside batch(), the values written next are placed after the deletes;
+        # a repeated delete would remove other rows
+        self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.doc_id, body={'requests': requests}), idempotent=False)
+
     def upsert(self, title, df):
         # TODO this would be nice to have, add the sheet if it doesnt' exist
         try:
@@ -304,58 +1023,46 @@ class Sheet:
     def add_sheet(self, title):
         # TODO this not working yet
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {
-                        'addSheet': {
-                            'properties': {
-                                'title': title,
-                            },
-                        }
-                    }
-                ]
-            }).execute()
+        self._batch_update([
+            {
+                'addSheet': {
+                    'properties': {
+                        'title': title,
+                    },
+                }
+            }
+        ])
 
     def format_as_currency(self, title, column_index):
         sheet_id = self.get_sheet_id(title)
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {'repeatCell': {
-                        'range': {'sheetId': sheet_id, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
-                        'cell': {'userEnteredFormat': {'numberFormat': {'type': 'CURRENCY'}}},
-                        'fields': 'userEnteredFormat.numberFormat',
-                    }}
-                ]
-            }).execute()
+        self._batch_update([
+            {'repeatCell': {
+                'range': {'sheetId': sheet_id, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
+                'cell': {'userEnteredFormat': {'numberFormat': {'type': 'CURRENCY'}}},
+                'fields': 'userEnteredFormat.numberFormat',
+            }}
+        ])
 
     def format_as_percent(self, title, column_index):
         sheet_id = self.get_sheet_id(title)
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {'repeatCell': {
-                        'range': {'sheetId': sheet_id, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
-                        'cell': {'userEnteredFormat': {'numberFormat': {'type': 'PERCENT', 'pattern': '##.00%'}}},
-                        'fields': 'userEnteredFormat.numberFormat',
-                    }}
-                ]
-            }).execute()
+        self._batch_update([
+            {'repeatCell': {
+                'range': {'sheetId': sheet_id, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
+                'cell': {'userEnteredFormat': {'numberFormat': {'type': 'PERCENT', 'pattern': '##.00%'}}},
+                'fields': 'userEnteredFormat.numberFormat',
+            }}
+        ])
 
     def update_doc_title(self, new_title):
         # todo: this is not working yet
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {'updateSheetProperties': {
-                        'properties': {'title': new_title},
-                    }},
+        self._batch_update([
+            {'updateSheetProperties': {
+                'properties': {'title': new_title},
+            }},
 
-                ]
-            }).execute()
+        ])
 
     def validate(self, title, column_index, valid_values):
         """
@@ -366,22 +1073,25 @@ class Sheet:
 
         values = [{"userEnteredValue": x} for x in valid_values]
 
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.doc_id, body={
-                'requests': [
-                    {'setDataValidation': {
-                        'range': {'sheetId': sheet_id, "startRowIndex": 1, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
-                        'rule': {
-                            'condition': {
-                                "type": 'ONE_OF_LIST',
-                                "values": values
-                            },
-                            'showCustomUi': True,
-                            "strict": True
-                        },
-                    }},
-                ]
-            }).execute()
+        self._batch_update([
+            {'setDataValidation': {
+                'range': {'sheetId': sheet_id, "startRowIndex": 1, "startColumnIndex": column_index, "endColumnIndex": column_index + 1},
+                'rule': {
+                    'condition': {
+                        "type": 'ONE_OF_LIST',
+                        "values": values
+                    },
+                    'showCustomUi': True,
+                    "strict": True
+                },
+            }},
+        ])
+
+    def _sheet_properties(self, title):
+        for sheet in self.sheet_metadata['sheets']:
+            if sheet['properties']['title'] == title:
+                return sheet['properties']
+        return None
 
     def get_sheet_id(self, title):
         """
@@ -400,106 +1110,99 @@ class Sheet:
         else:
             return "https://docs.google.com/spreadsheets/d/%s/edit#gid=%s" % (self.doc_id, self.get_sheet_id(title))
 
-    def preserve(self, sheet_title, new_sheet_df, keys, columns):
+    def preserve(self, sheet_title, new_sheet_df, keys, columns, cache_dir=ANNOTATION_CACHE):
         """
-        Load a sheet, and attach the preserved values to new_sheet_df then return the new dataframe.
+        Attach the values people typed on a tab to new_sheet_df and return the new dataframe.
         An example is to join on keys=['candidate_id'], attache on columns=['action', 'action notes']
-        """
-        # load sheet
-        manually_confirmed = self.load(sheet_title)
 
-        if len(manually_confirmed) > 0:
-            # add columns if missed
+        Only the key and annotation columns are read from the tab. Annotations are also kept in a
+        local cache, keyed like the tab, so they come back for rows that were off the tab for a
+        while; for rows on the tab, the tab wins. Values already in new_sheet_df are kept, only
+        blanks are filled.
+        """
+        annotations, tab_keys = self._read_annotations(sheet_title, keys, columns)
+        path = annotation_cache_path(cache_dir, self.doc_id, sheet_title) if cache_dir else None
+        if path:
+            cached = load_annotations(path)
+            if annotations is not None:
+                cached.update(annotations)
+                # rows on the tab whose annotations were cleared
+                for key in tab_keys - set(annotations):
+                    cached.pop(key, None)
+                save_annotations(cached, path)
+            annotations = cached
+
+        df = new_sheet_df.copy()
+        if annotations and all(k in df for k in keys):
+            row_keys = row_key_strings(df, keys)
             for c in columns:
-                if c not in manually_confirmed:
-                    manually_confirmed[c] = ''
-
-            # make sure all the keys are in the loaded sheet, if you just changed the dataframe,
-            # the key will not be at the sheet yet. In this case, skip
-            keys_available = True
-
-            for c in keys:
-                if c not in manually_confirmed:
-                    keys_available = False
-                    break
-
-            if keys_available:
-                # select non-blank rows
-                manually_confirmed = manually_confirmed[manually_confirmed[columns].any(
-                    axis=1)]
-
-                # merge with new_sheet_df
-                new_sheet_with_preserved_values = merge_overlapping(new_sheet_df,
-                                                                    manually_confirmed[keys + columns], on=keys, how='left')
-                new_sheet_with_preserved_values.drop(
-                    '_merge', axis=1, inplace=True)
+                preserved = row_keys.map({key: values[c] for key, values in annotations.items() if values.get(c)})
+                if c in df:
+                    df[c] = df[c].where(~bnull(df[c]) | preserved.isnull(), preserved)
+                else:
+                    df[c] = preserved
+
+        # add columns if missed
+        for c in columns:
+            if c not in df:
+                df[c] = ''
             else:
-                new_sheet_with_preserved_values = new_sheet_df
+                df[c] = df[c].where(df[c].notnull(), '')
 
-        else:
-            new_sheet_with_preserved_values = new_sheet_df
+        return df
+
+    def _read_annotations(self, title, keys, columns):
+        """
+        ({row key: {column: value}} for the tab's rows with any annotation, the set of row keys on the tab),
+        or (None, None) if the tab has no keys yet
+        """
+        tab = self.load_many([title], columns=keys + columns, fill='')[title]
+        if not all(k in tab for k in keys):
+            # if you just changed the dataframe, the keys will not be at the sheet yet
+            return None, None
 
-        # add columns if missed
         for c in columns:
-            if c not in new_sheet_with_preserved_values:
-                new_sheet_with_preserved_values[c] = ''
+            if c not in tab:
+                tab[c] = ''
+        row_keys = row_key_strings(tab, keys)
 
-        return new_sheet_with_preserved_values
+        annotated = (tab[columns] != '').any(axis=1)
+        values = tab.loc[annotated, columns].astype(str).to_dict('records')
+        return dict(zip(row_keys[annotated], values)), set(row_keys)
 
     def select_confirmed(self, title, df, keys):
         """
         select where action is 'confirmed'
         """
-        manually_confirmed = self.load(title)
-        manually_confirmed = manually_confirmed[manually_confirmed['action'] == 'confirmed']
+        tab = self.load_many([title], columns=keys + ['action'], fill='')[title]
+        if 'action' in tab and all(k in tab for k in keys):
+            confirmed = set(row_key_strings(tab[tab['action'] == 'confirmed'], keys))
+        else:
+            confirmed = set()
 
         print('%s manually confirmed rows in %s' %
-              (len(manually_confirmed), title))
+              (len(confirmed), title))
 
-        if len(manually_confirmed) > 0:
-
-            # make sure keys are in the same datatype
-            for k in keys:
-                df[k] = num_to_str(df[k])
-                manually_confirmed[k] = num_to_str(manually_confirmed[k])
-
-            df = merge_overlapping(
-                df, manually_confirmed[keys], on=keys, unique=False, how='left')
-
-            # select merged rows
-            df = df[df['_merge'] == 'both']
-
-            df.drop(['_merge'], axis=1, inplace=True)
-
-            return df
+        if len(confirmed) > 0:
+            # keys compare as the cell text, so 12 and '12' match
+            return df[row_key_strings(df, keys).isin(confirmed)].reset_index(drop=True)
         else:
             return pd.DataFrame()
 
     def get_column_index(self, title, column_label):
-        df = self.load(title)
-        column_index = df.iloc[0].index.tolist().index(column_label)
-        return column_index
+        columns = self._tab_index(title).columns
+        if _cell_str(column_label) not in columns:
+            raise ValueError('%s is not a column of %s' % (column_label, title))
+        return columns[_cell_str(column_label)]
 
     def get_row_index(self, title, row_label):
 
-        df = self.load(title)
-
         # the first column matches row_label
-        matching_rows = df[df.iloc[:, 0].str.lower() == row_label.lower()]
+        matching_rows = self._tab_index(title).row_labels.get(_cell_str(row_label).lower(), [])
 
         if len(matching_rows) == 1:
-
-            row_index = df[df.iloc[:, 0].str.lower() ==
-                           row_label.lower()].index[0]
-
-            # plus one because we skiped header
-            row_index += 1
-
-            # google sheet needs int not numpy.int
-            if isinstance(row_index, np.generic):
-                row_index = np.asscalar(row_index)
-
-            return row_index
+            # 0 based, counting the header
+            return matching_rows[0]
 
         else:
             print('%d rows match the row label %s, please check' %
@@ -510,11 +1213,11 @@ class Sheet:
         """
         Locate a cell by it's row label and column label
         return the location in A1 notation.
+
+        Both lookups use the cached labels of the tab, so only the first call reads them.
         """
 
-        # need to update the code when we had more than 26 columns
-        column = string.ascii_uppercase[self.get_column_index(
-            title, column_label)]
+        column = column_letter(self.get_column_index(title, column_label))
 
         # +1 because A1 notation starts from 1 and google api (get_row_index) starts from 0
         row = self.get_row_index(title, row_label) + 1
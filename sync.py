@@ -0,0 +1,305 @@
+"""
+Sync new mail contacts straight to the contact sheet, without the TSV in between
+
+python ./sync.py --store contacts.db [--interval SECONDS]
+
+The stages run in their own threads and pass work along bounded queues, so a slow stage
+holds back the ones before it instead of letting rows pile up, and the IMAP fetches,
+the rules and the Sheets appends overlap:
+
+    fetch (mail_lib.Ingestor) -> dedup -> classify (rules_lib.CONTACT_RULES) -> sheet -> store
+
+Only contacts the store has never seen are classified and appended to their tabs, and
+emails already on a tab are never appended to it again. A contact goes into the store once
+the sheet has it, and a folder's IMAP checkpoint is saved once the store has all of its
+contacts, so after a crash the next run fetches that mail again and nothing is lost.
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import perf_lib
+from contacts_lib import STORE_FILE, ContactStore, canonical_email
+from mail_lib import DEFAULT_FOLDERS, FETCH_BATCH_SIZE, IMAP_HOST, IMAP_WORKERS, SINCE, Ingestor, imap_connect, \
+    parse_folder
+from rules_lib import CONTACT_RULES
+from sheets_lib import Sheet
+
+CONTACT_SHEET = os.environ.get('CONTACT_SHEET_SPECIFIC')
+# separate from getmymail.py's, mail it already logged still has to reach the sheet
+CHECKPOINT_FILE = os.environ.get('FREECRM_SYNC_CHECKPOINT_FILE') or './.sync_checkpoints.json'
+# items each queue between two stages holds before the stage feeding it waits
+QUEUE_SIZE = int(os.environ.get('FREECRM_SYNC_QUEUE_SIZE') or 1000)
+# rows per classify and append batch
+BATCH_ROWS = int(os.environ.get('FREECRM_SYNC_BATCH_ROWS') or 500)
+# a partial batch is sent on after this many seconds without a new row
+FLUSH_SECONDS = float(os.environ.get('FREECRM_SYNC_FLUSH_SECONDS') or 2)
+
+END = ('end',)
+
+
+class Cancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """
+    The writer Ingestor.run writes to, feeding the first queue of the pipeline.
+
+    checkpoint() only returns once everything written before it is in the store, which
+    is what Ingestor expects before it saves a folder checkpoint.
+    """
+
+    def __init__(self, pipeline, path):
+        self.pipeline = pipeline
+        self.path = path
+        self.rows_written = 0
+
+    def write(self, row):
+        self.pipeline._put(self.pipeline.fetched, ('row', row))
+        self.rows_written += 1
+
+    def checkpoint(self):
+        done = threading.Event()
+        self.pipeline._put(self.pipeline.fetched, ('checkpoint', done))
+        while not done.wait(1):
+            if self.pipeline.stop.is_set():
+                raise Cancelled('sync cancelled')
+
+
+class Pipeline:
+    """
+    One pass of run() syncs the new mail of every folder; keep the object around to run
+    it again, the emails known to the store and on each tab are only read on the first pass.
+
+    :param ingestor: a mail_lib.Ingestor; its rows are deduplicated again against the store
+    :param sheet: a sheets_lib.Sheet, only used from the sheet stage's thread once running
+    :param store_path: the ContactStore, opened in the store stage's thread since sqlite
+        connections stay in the thread that made them
+    """
+
+    def __init__(self, ingestor, sheet, store_path=STORE_FILE, rules=CONTACT_RULES, queue_size=QUEUE_SIZE,
+                 batch_rows=BATCH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.ingestor = ingestor
+        self.sheet = sheet
+        self.store_path = store_path
+        self.rules = rules
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+
+        # canonical emails in the store, and on each tab
+        self.known = None
+        self.on_tab = None
+
+    def load_known(self):
+        with ContactStore(self.store_path) as store:
+            known = store.email_keys()
+        frames = self.sheet.load_many(self.rules.tabs, columns=['email'])
+        self.on_tab = {tab: {canonical_email(e) for e in frames[tab].get('email', []) if e}
+                       for tab in self.rules.tabs}
+        self.known = known
+        print('%d contacts in the store, %s on the sheet' % (
+            len(self.known), ', '.join('%d on %s' % (len(self.on_tab[tab]), tab) for tab in self.rules.tabs)))
+
+    def _put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        raise Cancelled('sync cancelled')
+
+    def _get(self, q, timeout=None):
+        """
+        the next item of q, or None once timeout seconds pass without one
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.stop.is_set():
+            wait = 1 if deadline is None else min(1, deadline - time.time())
+            if wait <= 0:
+                return None
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                pass
+        raise Cancelled('sync cancelled')
+
+    def _start(self, name, stage, *args):
+        def run():
+            try:
+                stage(*args)
+            except Cancelled:
+                pass
+            except Exception as e:
+                print('Error in the %s stage: %s' % (name, e))
+                self.errors.append(e)
+                self.stop.set()
+
+        thread = threading.Thread(target=run, name='sync-' + name, daemon=True)
+        thread.start()
+        return thread
+
+    def _dedup(self, source, sink):
+        """
+        marks each row new or not; the rows the store has seen are only passed on to be
+        upserted there, which fills in names it lacks
+        """
+        while True:
+            item = self._get(source)
+            if item[0] == 'row':
+                row = item[1]
+                key = canonical_email(row[1])
+                is_new = key not in self.known
+                self.known.add(key)
+                item = ('row', row, is_new)
+            self._put(sink, item)
+            if item is END:
+                return
+
+    def _classify(self, source, sink):
+        rows = []
+        new = []
+
+        def flush():
+            if not rows:
+                return
+            batch = pd.DataFrame(new, columns=ContactStore.columns)
+            with perf_lib.stage('classify', rows_in=len(batch)) as timing:
+                hits = self.rules.match(batch)
+                routed = {tab: batch[hits[tab]] for tab in self.rules.tabs if hits[tab].any()}
+                timing.add(rows_out=sum(len(df) for df in routed.values()))
+            self._put(sink, ('batch', list(rows), routed))
+            del rows[:], new[:]
+
+        while True:
+            item = self._get(source, self.flush_seconds if rows else None)
+            if item is None:
+                flush()
+                continue
+            if item[0] == 'row':
+                rows.append(item[1])
+                if item[2]:
+                    new.append(item[1])
+                if len(rows) >= self.batch_rows:
+                    flush()
+                continue
+            # a checkpoint or the end, everything before it goes on first
+            flush()
+            self._put(sink, item)
+            if item is END:
+                return
+
+    def _append(self, source, sink):
+        while True:
+            item = self._get(source)
+            if item[0] == 'batch':
+                _, rows, routed = item
+                for tab, df in routed.items():
+                    keys = df.email.map(canonical_email)
+                    fresh = ~keys.isin(self.on_tab[tab]) & ~keys.duplicated()
+                    self.appended[tab] = self.appended.get(tab, 0) + self.sheet.append(tab, df[fresh])
+                    self.on_tab[tab].update(keys[fresh])
+                item = ('rows', rows)
+            self._put(sink, item)
+            if item is END:
+                return
+
+    def _store(self, source):
+        with ContactStore(self.store_path) as store:
+            while True:
+                item = self._get(source)
+                if item[0] == 'rows':
+                    for row in item[1]:
+                        store.write(row)
+                elif item[0] == 'checkpoint':
+                    store.checkpoint()
+                    item[1].set()
+                else:
+                    return
+
+    def run(self):
+        """
+        Sync the new mail once. Returns {tab: rows appended}.
+        """
+        if self.known is None:
+            self.load_known()
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.appended = {}
+        self.fetched = queue.Queue(self.queue_size)
+        deduped = queue.Queue(self.queue_size)
+        classified = queue.Queue(max(1, self.queue_size // self.batch_rows))
+        appended = queue.Queue(max(1, self.queue_size // self.batch_rows))
+        threads = [
+            self._start('dedup', self._dedup, self.fetched, deduped),
+            self._start('classify', self._classify, deduped, classified),
+            self._start('sheet', self._append, classified, appended),
+            self._start('store', self._store, appended),
+        ]
+
+        writer = _QueueWriter(self, self.store_path)
+        try:
+            fetched = self.ingestor.run(writer)
+            self._put(self.fetched, END)
+        except BaseException as e:
+            self.stop.set()
+            # rows dedup saw may not have reached the store, read it again next pass
+            self.known = None
+            for thread in threads:
+                thread.join()
+            # a failing stage cancels the fetch, its error is the one to report
+            raise self.errors[0] if self.errors else e
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            self.known = None
+            raise self.errors[0]
+
+        print('%d contacts fetched, %s' % (
+            fetched, ', '.join('%d appended to %s' % (n, tab) for tab, n in self.appended.items()) or 'none appended'))
+        return self.appended
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sync the contacts from new IMAP messages to the contact sheet')
+    parser.add_argument('--folder', dest='folders', action='append', type=parse_folder,
+                        help='folder to sync as NAME[:sent|:received], repeatable (default: gmail sent, important and starred)')
+    parser.add_argument('--store', default=STORE_FILE, help='contact store (.db) of the contacts already synced')
+    parser.add_argument('--sheet', default=CONTACT_SHEET, help='spreadsheet id (default: $CONTACT_SHEET_SPECIFIC)')
+    parser.add_argument('--checkpoint-file', default=CHECKPOINT_FILE)
+    parser.add_argument('--since', type=lambda d: datetime.strptime(d, '%Y-%m-%d').date(), default=SINCE,
+                        help='oldest mail fetched for a folder without a checkpoint, YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=IMAP_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=FETCH_BATCH_SIZE)
+    parser.add_argument('--host', default=IMAP_HOST)
+    parser.add_argument('--interval', type=float, default=0,
+                        help='keep running, checking for new mail every INTERVAL seconds')
+    args = parser.parse_args(argv)
+
+    ingestor = Ingestor(imap_connect(args.host), args.folders or DEFAULT_FOLDERS, since=args.since,
+                        workers=args.workers, batch_size=args.batch_size, checkpoint_path=args.checkpoint_file)
+    pipeline = Pipeline(ingestor, Sheet(args.sheet), args.store)
+    while True:
+        try:
+            pipeline.run()
+        except Exception as e:
+            if not args.interval:
+                raise
+            # the next pass reads the store and the sheet again and fetches from the saved checkpoints
+            print('Error syncing, trying again in %gs: %s' % (args.interval, e))
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
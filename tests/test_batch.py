@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet
+
+
+def make_sheet():
+    service = FakeService(tabs={'report': []})
+    sheet = Sheet('doc', service=service, executor=Executor())
+    sheet.upload('report', pd.DataFrame({'label': ['a', 'b'], 'x': [1.5, None], 'y': [None, None]}))
+    service.reset_counters()
+    return sheet, service
+
+
+def test_block_sends_one_batch_update_and_one_values_batch_update():
+    sheet, service = make_sheet()
+
+    with sheet.batch():
+        for column in range(3):
+            sheet.format_as_currency('report', column)
+        with sheet.batch():
+            sheet.update_cell('report', 'C2', 7)
+            sheet.update_cell('report', 'C3', 8)
+        assert service.requests == 0
+
+    assert service.calls == {'sheets.spreadsheets.batchUpdate': 1, 'sheets.spreadsheets.values.batchUpdate': 1}
+    assert [row[2] for row in service._tab('report')['rows'][1:]] == [7, 8]
+
+
+@pytest.mark.parametrize('error', [ValueError, KeyboardInterrupt])
+def test_nothing_is_sent_when_the_block_raises(error):
+    sheet, service = make_sheet()
+
+    with pytest.raises(error):
+        with sheet.batch():
+            sheet.format_as_currency('report', 1)
+            sheet.update_cell('report', 'C2', 7)
+            raise error()
+    assert service.requests == 0
+
+    # and the Sheet is back to sending right away
+    sheet.format_as_currency('report', 1)
+    assert service.calls['sheets.spreadsheets.batchUpdate'] == 1
@@ -0,0 +1,55 @@
+import os
+
+from contacts_lib import ContactStore
+
+
+def store_path(tmp_path):
+    return os.path.join(str(tmp_path), 'contacts.db')
+
+
+def test_first_row_wins_and_blank_names_are_filled(tmp_path):
+    with ContactStore(store_path(tmp_path)) as store:
+        store.write(('', 'Ann@Example.org', 'hi'))
+        store.write(('Ann', 'ann@example.org', 'again'))
+        store.write(('Bob', 'bob@example.org', 'yo'))
+
+    with ContactStore(store_path(tmp_path)) as store:
+        df = store.to_dataframe()
+    assert df.values.tolist() == [['Ann', 'Ann@Example.org', 'hi'], ['Bob', 'bob@example.org', 'yo']]
+
+
+def test_changed_since_a_checkpoint(tmp_path):
+    with ContactStore(store_path(tmp_path)) as store:
+        store.write(('Ann', 'ann@example.org', ''))
+
+    reader = ContactStore(store_path(tmp_path))
+    reader.set_checkpoint('test', reader.latest_version())
+
+    with ContactStore(store_path(tmp_path)) as store:
+        store.write(('Bob', 'bob@example.org', ''))
+
+    since = reader.get_checkpoint('test')
+    assert reader.to_dataframe(since=since).email.tolist() == ['bob@example.org']
+    reader.close()
+
+
+def test_readers_wait_for_open_sessions(tmp_path):
+    path = store_path(tmp_path)
+    ingest = ContactStore(path, buffer_rows=1)
+    # committed, but the session is still writing
+    ingest.write(('Ann', 'ann@example.org', ''))
+
+    with ContactStore(path) as other:
+        other.write(('Bob', 'bob@example.org', ''))
+    # two sessions at once get their own versions
+    assert other.version != ingest.version
+
+    reader = ContactStore(path)
+    until = reader.latest_version()
+    assert until < ingest.version
+    assert reader.to_dataframe(since=0, until=until).empty
+
+    ingest.write(('Cid', 'cid@example.org', ''))
+    ingest.close()
+    assert sorted(reader.to_dataframe(since=until).email) == ['ann@example.org', 'bob@example.org', 'cid@example.org']
+    reader.close()
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from fake_imap import FakeIMAPServer
+from mail_lib import DEFAULT_FOLDERS, Ingestor, load_checkpoints
+
+FOLDERS = {'[Gmail]/Sent Mail': 20, '[Gmail]/Important': 100, '[Gmail]/Starred': 10}
+
+
+class ListWriter:
+    path = 'memory'
+
+    def __init__(self):
+        self.rows = []
+        self.checkpoints = 0
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def checkpoint(self):
+        self.checkpoints += 1
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return os.path.join(str(tmp_path), 'checkpoints.json')
+
+
+def ingest(server, checkpoint_path, dedup=False):
+    writer = ListWriter()
+    Ingestor(server.connect, DEFAULT_FOLDERS, workers=2, batch_size=7, checkpoint_path=checkpoint_path,
+             dedup=dedup).run(writer)
+    return writer
+
+
+def test_first_run_fetches_everything_and_saves_checkpoints(checkpoint_path):
+    server = FakeIMAPServer(FOLDERS)
+
+    writer = ingest(server, checkpoint_path)
+
+    assert server.messages_fetched == 130
+    # a checkpoint per folder, each after its rows were written
+    assert writer.checkpoints == 3
+    checkpoints = load_checkpoints(checkpoint_path)
+    assert checkpoints['[Gmail]/Important']['last_uid'] == 100
+    assert checkpoints['[Gmail]/Sent Mail']['last_uid'] == 20
+
+
+def test_resume_fetches_only_new_mail(checkpoint_path):
+    server = FakeIMAPServer(FOLDERS)
+    ingest(server, checkpoint_path)
+
+    server.reset_counters()
+    ingest(server, checkpoint_path)
+    assert server.messages_fetched == 0
+
+    server.folders['[Gmail]/Important'].add_messages(15)
+    server.reset_counters()
+    ingest(server, checkpoint_path)
+    assert server.messages_fetched == 15
+    assert load_checkpoints(checkpoint_path)['[Gmail]/Important']['last_uid'] == 115
+
+
+def test_uidvalidity_reset_refetches_the_folder(checkpoint_path):
+    server = FakeIMAPServer(FOLDERS)
+    ingest(server, checkpoint_path)
+
+    server.reset_uidvalidity('[Gmail]/Starred')
+    server.reset_counters()
+    ingest(server, checkpoint_path)
+
+    # the old uids mean nothing now, the folder is read again from `since`; the others are not
+    assert server.messages_fetched == 10
+    checkpoint = load_checkpoints(checkpoint_path)['[Gmail]/Starred']
+    assert checkpoint['uidvalidity'] == server.folders['[Gmail]/Starred'].uidvalidity
+
+
+def test_dedup_writes_each_email_once(checkpoint_path):
+    server = FakeIMAPServer(FOLDERS, senders=20)
+
+    writer = ingest(server, checkpoint_path, dedup=True)
+
+    emails = [row[1] for row in writer.rows]
+    assert len(emails) == len(set(emails))
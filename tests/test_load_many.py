@@ -0,0 +1,45 @@
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet
+
+TABS = {
+    'people': [['email', 'name', 'notes'], ['a@x.com', 'A', 'n1'], ['b@x.com', '', 'n2'], ['', 'C']],
+    'companies': [['name', 'email'], ['X', 'x@x.com']],
+    'empty': [],
+}
+
+
+def make_sheet():
+    service = FakeService(tabs=TABS)
+    sheet = Sheet('doc', service=service, executor=Executor())
+    service.reset_counters()
+    return sheet, service
+
+
+def test_columns_are_read_in_two_batch_gets():
+    sheet, service = make_sheet()
+
+    frames = sheet.load_many(['people', 'companies', 'empty'], columns=['email', 'name'])
+
+    assert service.calls == {'sheets.spreadsheets.values.batchGet': 2}
+    assert list(frames['people'].columns) == ['email', 'name']
+    assert list(frames['companies'].columns) == ['email', 'name']
+    assert frames['empty'].empty
+
+
+def test_columns_match_a_full_load():
+    sheet, _ = make_sheet()
+
+    full = sheet.load_many(['people', 'companies'])
+    some = sheet.load_many(['people', 'companies'], columns=['email', 'name'])
+
+    for title in ['people', 'companies']:
+        assert some[title].fillna('').values.tolist() == full[title][['email', 'name']].fillna('').values.tolist()
+
+
+def test_missing_labels_are_left_out():
+    sheet, _ = make_sheet()
+
+    frames = sheet.load_many(['people', 'companies'], columns=['notes'])
+
+    assert frames['people'].notes.tolist() == ['n1', 'n2']
+    assert 'notes' not in frames['companies']
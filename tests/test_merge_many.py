@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from merge_lib import merge_many, merge_overlapping
+
+
+def frames():
+    a = pd.DataFrame({'email': ['a@x.org', 'b@x.org', 'c@x.org'],
+                      'name': ['Ann', '', None],
+                      'phone': ['1', None, '3']})
+    b = pd.DataFrame({'email': ['b@x.org', 'c@x.org', 'd@x.org'],
+                      'name': ['Bob', 'Cid', 'Dee'],
+                      'notes': ['met', '', 'call']})
+    c = pd.DataFrame({'email': ['d@x.org', 'a@x.org', 'e@x.org'],
+                      'name': ['Dee D', 'Annie', 'Eve'],
+                      'phone': ['4', '9', None],
+                      'notes': [None, 'vip', 'new']})
+    return [a, b, c]
+
+
+def chained(dfs, how):
+    df = dfs[0]
+    for right in dfs[1:]:
+        df = merge_overlapping(df, right, how=how, on=['email'])
+    return df
+
+
+@pytest.mark.parametrize('how', ['outer', 'left', 'right', 'inner'])
+def test_merge_many_matches_chained_merge_overlapping(how):
+    expected = chained(frames(), how).reset_index(drop=True)
+    result = merge_many(frames(), on=['email'], how=how).reset_index(drop=True)
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_merge_many_with_an_empty_source():
+    dfs = frames()
+    dfs[1] = dfs[1].iloc[:0]
+
+    expected = chained(dfs, 'outer').reset_index(drop=True)
+    result = merge_many(dfs, on=['email']).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def by_key(df):
+    return df.set_index('email').sort_index()[sorted(c for c in df.columns if c != 'email')]
+
+
+def test_precedence_matches_chaining_in_that_order():
+    dfs = frames()
+
+    expected = chained([dfs[2], dfs[0], dfs[1]], 'outer')
+    result = merge_many(dfs, on=['email'], precedence=[2, 0, 1])
+
+    pd.testing.assert_frame_equal(by_key(result), by_key(expected), check_dtype=False)
+    # frames left out come after the ones listed, in frames order
+    pd.testing.assert_frame_equal(merge_many(dfs, on=['email'], precedence=[2]), result)
+
+
+@pytest.mark.parametrize('precedence', [[0, 0, 1], [1, 3]])
+def test_precedence_must_list_distinct_positions(precedence):
+    with pytest.raises(ValueError):
+        merge_many(frames(), on=['email'], precedence=precedence)
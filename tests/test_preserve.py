@@ -0,0 +1,59 @@
+import pandas as pd
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet
+
+TAB = [['id', 'name', 'action', 'action notes'],
+       [1, 'a', 'confirmed', 'call back'],
+       [2, 'b', '', ''],
+       [3, 'c', 'skip', '']]
+
+
+def make_sheet(rows=TAB):
+    service = FakeService(tabs={'candidates': [list(row) for row in rows]})
+    sheet = Sheet('doc', service=service, executor=Executor())
+    service.reset_counters()
+    return sheet, service
+
+
+def test_annotations_follow_their_keys(tmp_path):
+    sheet, service = make_sheet()
+    new = pd.DataFrame({'id': [3, 4, 1], 'name': ['c', 'd', 'a']})
+
+    df = sheet.preserve('candidates', new, ['id'], ['action', 'action notes'], cache_dir=str(tmp_path))
+
+    assert df['action'].tolist() == ['skip', '', 'confirmed']
+    assert df['action notes'].tolist() == ['', '', 'call back']
+    # only the key and annotation columns, two batchGets
+    assert service.calls == {'sheets.spreadsheets.values.batchGet': 2}
+
+
+def test_values_in_the_new_frame_win(tmp_path):
+    sheet, _ = make_sheet()
+    new = pd.DataFrame({'id': [1, 3], 'action': ['', 'review']})
+
+    df = sheet.preserve('candidates', new, ['id'], ['action'], cache_dir=str(tmp_path))
+
+    assert df['action'].tolist() == ['confirmed', 'review']
+
+
+def test_the_cache_brings_annotations_back(tmp_path):
+    sheet, service = make_sheet()
+    sheet.preserve('candidates', pd.DataFrame({'id': [1]}), ['id'], ['action'], cache_dir=str(tmp_path))
+
+    # row 1 leaves the tab, row 3 is cleared on it
+    service._tab('candidates')['rows'] = [TAB[0], [2, 'b', '', ''], [3, 'c', '', '']]
+    sheet.preserve('candidates', pd.DataFrame({'id': [2]}), ['id'], ['action'], cache_dir=str(tmp_path))
+    df = sheet.preserve('candidates', pd.DataFrame({'id': [1, 3]}), ['id'], ['action'], cache_dir=str(tmp_path))
+
+    assert df['action'].tolist() == ['confirmed', '']
+
+
+def test_select_confirmed_matches_keys_as_text():
+    sheet, service = make_sheet()
+    df = pd.DataFrame({'id': ['1', '2', '3'], 'name': ['a', 'b', 'c']})
+
+    confirmed = sheet.select_confirmed('candidates', df, ['id'])
+
+    assert confirmed['name'].tolist() == ['a']
+    assert service.calls == {'sheets.spreadsheets.values.batchGet': 2}
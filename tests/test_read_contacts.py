@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+
+from contacts_lib import iter_unique, read_contacts
+
+
+def write_tsv(tmp_path, rows):
+    path = os.path.join(str(tmp_path), 'contacts.csv')
+    pd.DataFrame(rows, columns=['name', 'email', 'subject']).to_csv(path, sep='\t', index=False)
+    return path
+
+
+ROWS = [
+    ['Ann', 'ann@example.org', 'a'],
+    ['Bob', 'bob@example.org', 'b'],
+    ['Ann 2', 'ann@example.org', 'c'],
+    ['No email', None, 'd'],
+    ['Cid', 'cid@example.org', 'e'],
+    ['No email 2', None, 'f'],
+    ['Bob 2', 'bob@example.org', 'g'],
+    ['Dee', 'dee@example.org', 'h'],
+]
+
+
+def test_iter_unique_matches_drop_duplicates(tmp_path):
+    path = write_tsv(tmp_path, ROWS)
+    expected = pd.read_csv(path, sep='\t').drop_duplicates('email')
+
+    for chunksize in (1, 2, 3, 100):
+        result = pd.concat(iter_unique(path, chunksize=chunksize))
+        pd.testing.assert_frame_equal(result, expected)
+
+
+def test_read_contacts_merges_case_variants(tmp_path):
+    path = write_tsv(tmp_path, ROWS + [['Old', ' DEE@Example.org', 'i'], ['Eve', 'EVE@example.org', 'j']])
+
+    for chunksize in (None, 2):
+        df = read_contacts(path, chunksize=chunksize)
+        assert df.email.dropna().tolist() == ['ann@example.org', 'bob@example.org', 'cid@example.org',
+                                              'dee@example.org', 'eve@example.org']
+        assert df[df.email == 'dee@example.org'].name.tolist() == ['Dee']
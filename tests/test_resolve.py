@@ -0,0 +1,31 @@
+import pandas as pd
+
+from resolve_lib import resolve
+
+CONTACTS = pd.DataFrame({
+    'name': ['John Smith', 'Smith, John', 'Ann Lee', '', 'Jane Doe'],
+    'email': ['john@work.com', 'Smith.J@home.org', 'ann@x.com', 'jdoe77@a.com', 'jdoe77@b.com'],
+})
+
+
+def test_clusters_are_named_after_their_smallest_email():
+    ids = resolve(CONTACTS)
+
+    assert ids.tolist() == ['john@work.com', 'john@work.com', 'ann@x.com', 'jdoe77@a.com', 'jdoe77@a.com']
+
+
+def test_ids_do_not_depend_on_row_order():
+    ids = resolve(CONTACTS)
+    shuffled = CONTACTS.iloc[[4, 2, 0, 3, 1]]
+
+    assert resolve(shuffled).to_dict() == ids.to_dict()
+
+    # a contact added in front moves every position, not the ids
+    more = pd.concat([pd.DataFrame({'name': ['Bob Stone'], 'email': ['bob@y.com']}), CONTACTS], ignore_index=True)
+    assert resolve(more).tolist()[1:] == ids.tolist()
+
+
+def test_a_cluster_without_email_falls_back_to_its_position():
+    ids = resolve(pd.DataFrame({'name': ['Ann Lee', 'Bob Stone'], 'email': [None, 'bob@y.com']}))
+
+    assert ids.tolist() == ['0', 'bob@y.com']
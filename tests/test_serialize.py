@@ -0,0 +1,41 @@
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+from sheets_lib import serialize_frame
+
+
+def test_blanks_dates_and_python_numbers():
+    df = pd.DataFrame({
+        'name': ['Ann', None],
+        'count': np.array([1, 2], dtype='int64'),
+        'amount': [1.5, np.nan],
+        'ok': [True, False],
+        'day': [datetime.date(2019, 1, 2), None],
+        'seen': pd.to_datetime(['2019-01-02 10:00', None]),
+    })
+
+    header, rows = serialize_frame(df)
+
+    assert header == ['name', 'count', 'amount', 'ok', 'day', 'seen']
+    assert rows == [['Ann', 1, 1.5, True, '2019-01-02', '2019-01-02'], ['', 2, '', False, '', '']]
+    assert type(rows[0][1]) is int
+    # the frame passed in is left alone
+    assert df.amount.isnull().iloc[1]
+
+
+def test_nullable_and_timedelta_columns_are_json_friendly():
+    df = pd.DataFrame({
+        'i': pd.array([1, None], dtype='Int64'),
+        'b': pd.array([True, None], dtype='boolean'),
+        'f': pd.array([0.5, None], dtype='Float64'),
+        's': pd.array(['a', None], dtype='string'),
+        'td': pd.to_timedelta(['1 day', None]),
+    })
+
+    header, rows = serialize_frame(df)
+
+    assert rows == [[1, True, 0.5, 'a', '1 days'], ['', '', '', '', '']]
+    json.dumps(rows)
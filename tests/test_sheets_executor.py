@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+from googleapiclient.errors import HttpError
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet
+
+
+def make_sheet(tabs=None, max_retries=6):
+    sleeps = []
+    service = FakeService(tabs=tabs or {'contacts': [['name', 'email'], ['Ann', 'ann@example.org']]})
+    # random() == 1 makes each backoff its full cap
+    executor = Executor(max_retries=max_retries, sleep=sleeps.append, random=lambda: 1.0)
+    return Sheet('doc', service=service, executor=executor), service, sleeps
+
+
+def test_retries_server_errors_with_exponential_backoff():
+    sheet, service, sleeps = make_sheet()
+    service.fail_next(503, 3)
+
+    df = sheet.load('contacts')
+
+    assert df.email.tolist() == ['ann@example.org']
+    assert sleeps == [1, 2, 4]
+    assert sheet.executor.metrics['sheets.spreadsheets.values.batchGet']['retries'] == 3
+
+
+def test_backoff_is_capped():
+    sheet, service, sleeps = make_sheet()
+    sheet.executor.max_delay = 4
+    service.fail_next(429, 5)
+
+    sheet.load('contacts')
+
+    assert sleeps == [1, 2, 4, 4, 4]
+
+
+def test_gives_up_after_max_retries():
+    sheet, service, sleeps = make_sheet(max_retries=2)
+    service.fail_next(500, 3)
+
+    with pytest.raises(HttpError):
+        sheet.load('contacts')
+    assert len(sleeps) == 2
+    assert sheet.executor.metrics['sheets.spreadsheets.values.batchGet']['errors'] == 1
+
+
+def test_client_errors_are_not_retried():
+    sheet, service, sleeps = make_sheet()
+    service.fail_next(403)
+
+    with pytest.raises(HttpError):
+        sheet.load('contacts')
+    assert sleeps == []
+
+
+def test_append_is_retried_on_429_only():
+    sheet, service, sleeps = make_sheet(tabs={'contacts': []})
+    sheet.upload('contacts', pd.DataFrame({'name': ['Ann'], 'email': ['ann@example.org']}))
+    row = pd.DataFrame({'name': ['Bob'], 'email': ['bob@example.org']})
+
+    service.fail_next(429)
+    assert sheet.append('contacts', row) == 1
+    assert len(sleeps) == 1
+
+    # a 503 may come after the rows were written, a retry could add them twice
+    service.fail_next(503)
+    with pytest.raises(HttpError):
+        sheet.append('contacts', row)
+    assert len(sleeps) == 1
+    assert [r[1] for r in service._tab('contacts')['rows']] == ['email', 'ann@example.org', 'bob@example.org']
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from fake_imap import FakeIMAPServer
+from fake_sheets import FakeService
+from mail_lib import DEFAULT_FOLDERS, Ingestor
+from sheets_lib import Executor, Sheet
+from sync import Pipeline
+
+
+def make_pipeline(tmp_path, server, service):
+    ingestor = Ingestor(server.connect, DEFAULT_FOLDERS, checkpoint_path=os.path.join(str(tmp_path), 'cp.json'))
+    sheet = Sheet('doc', service=service, executor=Executor(sleep=lambda seconds: None))
+    return Pipeline(ingestor, sheet, os.path.join(str(tmp_path), 'contacts.db'), batch_rows=50, flush_seconds=0.1)
+
+
+def tab_emails(service):
+    return [row[1].lower() for row in service._tab('CivicWriters')['rows'][1:]]
+
+
+def test_sync_appends_new_contacts_once(tmp_path):
+    server = FakeIMAPServer(senders=200)
+    service = FakeService(tabs={'CivicWriters': [['name', 'email', 'subject', 'notes'],
+                                                 ['Old', 'PERSON1@EXAMPLE.ORG', 'x', 'keep']]})
+    pipeline = make_pipeline(tmp_path, server, service)
+
+    appended = pipeline.run()
+    emails = tab_emails(service)
+    assert appended['CivicWriters'] == len(emails) - 1
+    assert len(emails) == len(set(emails))
+
+    server.folders['[Gmail]/Important'].add_messages(300)
+    pipeline.run()
+    emails = tab_emails(service)
+    assert len(emails) == len(set(emails))
+
+    # a fresh pipeline reads what the store and the tab already have
+    server.reset_counters()
+    assert make_pipeline(tmp_path, server, service).run() == {}
+    assert server.messages_fetched == 0
+
+
+def test_failed_pass_saves_no_checkpoints(tmp_path):
+    server = FakeIMAPServer(senders=200)
+    service = FakeService(tabs={'CivicWriters': [['name', 'email', 'subject']]})
+    pipeline = make_pipeline(tmp_path, server, service)
+    pipeline.load_known()
+
+    service.fail_next(403)
+    with pytest.raises(HttpError):
+        pipeline.run()
+    assert not os.path.exists(os.path.join(str(tmp_path), 'cp.json'))
+
+    pipeline.run()
+    emails = tab_emails(service)
+    assert emails and len(emails) == len(set(emails))
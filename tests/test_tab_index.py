@@ -0,0 +1,47 @@
+import pytest
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet, column_letter
+
+
+def make_sheet():
+    service = FakeService(tabs={'report': [['label', 'x', 2019], ['a'], ['b'], [2020]]})
+    sheet = Sheet('doc', service=service, executor=Executor())
+    service.reset_counters()
+    return sheet, service
+
+
+def test_labeled_updates_read_the_tab_once():
+    sheet, service = make_sheet()
+
+    for label in ['a', 'b', '2020']:
+        sheet.update_cell_by_row_and_column('report', label, 'x', 5)
+
+    assert service.calls == {'sheets.spreadsheets.values.batchGet': 1, 'sheets.spreadsheets.values.get': 1,
+                             'sheets.spreadsheets.values.update': 3}
+    assert [row[1] for row in service._tab('report')['rows'][1:]] == [5, 5, 5]
+
+
+def test_an_existing_value_is_not_overwritten():
+    sheet, service = make_sheet()
+    sheet.update_cell('report', 'B2', 5)
+
+    sheet.update_cell('report', 'B2', 6)
+
+    assert service.calls['sheets.spreadsheets.values.update'] == 1
+    assert service._tab('report')['rows'][1][1] == 5
+
+
+def test_numeric_labels_match_their_text():
+    sheet, service = make_sheet()
+
+    assert sheet.get_column_index('report', '2019') == 2
+    assert sheet.get_column_index('report', 2019) == 2
+    assert sheet.get_row_index('report', 2020) == sheet.get_row_index('report', '2020')
+    assert service.calls == {'sheets.spreadsheets.values.batchGet': 1}
+
+
+@pytest.mark.parametrize('index, letters', [(0, 'A'), (25, 'Z'), (26, 'AA'), (51, 'AZ'), (52, 'BA'), (701, 'ZZ'),
+                                            (702, 'AAA')])
+def test_column_letter(index, letters):
+    assert column_letter(index) == letters
@@ -0,0 +1,79 @@
+import json
+
+import pandas as pd
+import pytest
+from googleapiclient.errors import HttpError
+
+import sheets_lib
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet, chunk_rows
+
+
+def rows(count, width=4):
+    return [['cell %d.%d' % (i, j) for j in range(width)] for i in range(count)]
+
+
+def check_chunks(all_rows, chunks, max_bytes, max_cells):
+    # contiguous, in order, nothing lost
+    assert [row for _, part in chunks for row in part] == all_rows
+    assert [start for start, _ in chunks] == [sum(len(p) for _, p in chunks[:i]) for i in range(len(chunks))]
+    for _, part in chunks:
+        assert len(part) == 1 or sum(len(row) for row in part) <= max_cells
+        assert len(part) == 1 or len(json.dumps(part)) <= max_bytes
+
+
+@pytest.mark.parametrize('max_bytes, max_cells', [(10 ** 9, 10 ** 9), (10 ** 9, 400), (5000, 10 ** 9), (50, 10 ** 9)])
+def test_chunks_stay_under_the_budgets(max_bytes, max_cells):
+    all_rows = rows(1000)
+    chunks = chunk_rows(all_rows, max_bytes, max_cells)
+    check_chunks(all_rows, chunks, max_bytes, max_cells)
+    if max_bytes == max_cells == 10 ** 9:
+        assert len(chunks) == 1
+
+
+def test_an_outlier_row_is_measured():
+    all_rows = rows(1000)
+    all_rows[500] = ['x' * 20000]
+    chunks = chunk_rows(all_rows, 30000, 10 ** 9)
+    check_chunks(all_rows, chunks, 30000, 10 ** 9)
+    assert chunk_rows([]) == []
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    chunk = sheets_lib.chunk_rows
+    monkeypatch.setattr(sheets_lib, 'chunk_rows', lambda all_rows: chunk(all_rows, max_cells=300))
+
+
+def frame(count):
+    return pd.DataFrame({'email': ['p%d@example.org' % i for i in range(count)], 'n': range(count)})
+
+
+def test_large_upload_goes_through_a_staging_tab(small_chunks):
+    service = FakeService(tabs={'contacts': [['old'], ['row']]})
+    sheet = Sheet('doc', service=service, executor=Executor())
+
+    sheet.upload('contacts', frame(1000))
+
+    assert service.calls['sheets.spreadsheets.values.update'] == 7
+    assert [tab['title'] for tab in service.tabs] == ['contacts']
+    assert service._tab('contacts')['rows'] == [['email', 'n']] + frame(1000).values.tolist()
+
+
+def test_failed_chunk_leaves_the_tab_alone(small_chunks):
+    service = FakeService(tabs={'contacts': [['old'], ['row']]})
+    sheet = Sheet('doc', service=service, executor=Executor())
+    sheet.executor.max_retries = 0
+
+    original = service._write
+
+    def write(a1, values, option):
+        if a1.startswith("'contacts__staging'!A301"):
+            raise HttpError(sheets_lib.httplib2.Response({'status': 403}), b'{}')
+        return original(a1, values, option)
+    service._write = write
+
+    with pytest.raises(HttpError):
+        sheet.upload('contacts', frame(1000))
+    assert [tab['title'] for tab in service.tabs] == ['contacts']
+    assert service._tab('contacts')['rows'] == [['old'], ['row']]
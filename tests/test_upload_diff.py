@@ -0,0 +1,62 @@
+import pandas as pd
+
+from fake_sheets import FakeService
+from sheets_lib import Executor, Sheet
+
+
+def make_sheet(rows=200):
+    service = FakeService(tabs={'contacts': []})
+    sheet = Sheet('doc', service=service, executor=Executor())
+    df = pd.DataFrame({'email': ['p%d@example.org' % i for i in range(rows)],
+                       'name': ['Person %d' % i for i in range(rows)],
+                       'score': range(rows)})
+    sheet.upload('contacts', df)
+    return sheet, service, df
+
+
+def tab(service):
+    return service._tab('contacts')['rows']
+
+
+def expected(df):
+    return [list(df.columns)] + df.values.tolist()
+
+
+def test_removed_rows_are_deleted_not_rewritten():
+    sheet, service, df = make_sheet()
+    df = df.drop(index=[1, 2, 150])
+
+    written = sheet.upload_diff('contacts', df, 'email')
+
+    assert written == 0
+    assert tab(service) == expected(df)
+
+
+def test_changed_and_new_rows_only():
+    sheet, service, df = make_sheet()
+    df = df.drop(index=[5]).copy()
+    df.loc[100, 'name'] = 'Renamed'
+    df = pd.concat([df, pd.DataFrame({'email': ['new@example.org'], 'name': ['New'], 'score': [7]})],
+                   ignore_index=True)
+
+    written = sheet.upload_diff('contacts', df, 'email')
+
+    # the renamed row and the appended one, 3 cells each
+    assert written == 6
+    assert tab(service) == expected(df)
+
+
+def test_reads_the_tab_without_a_snapshot():
+    sheet, service, df = make_sheet()
+    sheet.refresh()
+
+    assert sheet.upload_diff('contacts', df.iloc[::2], 'email', use_snapshot=False) == 0
+    assert tab(service) == expected(df.iloc[::2])
+
+
+def test_header_change_uploads_everything():
+    sheet, service, df = make_sheet(rows=10)
+    df = df.rename(columns={'score': 'points'})
+
+    assert sheet.upload_diff('contacts', df, 'email') == 11 * 3
+    assert tab(service) == expected(df)